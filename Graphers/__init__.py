@@ -1 +1,3 @@
 from .grapher import MatplotlibGraphs
+from .downsample import Downsample
+from .writer import ReportWriter
@@ -0,0 +1,52 @@
+import numpy as np
+
+
+class Downsample:
+    """
+    Pick the indices of a time series worth drawing. minmax keeps the lowest and highest sample of
+    every bucket so no peak is lost, lttb (largest triangle three buckets) keeps the overall shape
+    with one sample per bucket.
+    """
+    @staticmethod
+    def indices(x, y, points, method='minmax'):
+        if method == 'lttb':
+            return Downsample.lttb(x, y, points)
+        return Downsample.minmax(y, points)
+
+    @staticmethod
+    def minmax(y, points):
+        n = len(y)
+        if points >= n or points < 4:
+            return np.arange(n)
+        size = -(-n // (points // 2))
+        buckets = -(-n // size)
+        padded = np.full(buckets * size, np.nan)
+        padded[:n] = y
+        padded = padded.reshape(buckets, size)
+        offsets = np.arange(buckets) * size
+        return np.unique(np.concatenate([[0, n - 1], offsets + np.nanargmin(padded, axis=1),
+                                         offsets + np.nanargmax(padded, axis=1)]))
+
+    @staticmethod
+    def lttb(x, y, points):
+        n = len(y)
+        if points >= n or points < 3:
+            return np.arange(n)
+        x = np.asarray(x, dtype='float64')
+        y = np.asarray(y, dtype='float64')
+        # first and last samples are always kept, everything between is split into points - 2 buckets
+        edges = np.linspace(1, n - 1, points - 1).astype(int)
+        selected = np.empty(points, dtype=int)
+        selected[0] = 0
+        selected[-1] = n - 1
+        previous = 0
+        for bucket in range(points - 2):
+            start, stop = edges[bucket], edges[bucket + 1]
+            following = edges[bucket + 2] if bucket + 2 < len(edges) else n
+            average_x = x[stop:following].mean()
+            average_y = y[stop:following].mean()
+            area = np.abs((x[previous] - average_x) * (y[start:stop] - y[previous]) -
+                          (x[previous] - x[start:stop]) * (average_y - y[previous]))
+            previous = start + int(np.argmax(area))
+            selected[bucket + 1] = previous
+        return selected
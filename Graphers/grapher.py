@@ -1,11 +1,21 @@
+import io
+import os
+import pickle
+import matplotlib
+# reports are only ever written to files, never shown, so skip loading a GUI backend
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 from matplotlib import dates
+from matplotlib.collections import PolyCollection
 from matplotlib.dates import DateFormatter
 from pandas.plotting import register_matplotlib_converters
 import pandas as pd
 import numpy as np
 import binascii as ba
 import matplotlib.dates as mdates
+from Helpers import Rollup
+from Helpers import StateSegments
+from .downsample import Downsample
 
 
 class MatplotlibGraphs:
@@ -14,56 +24,108 @@ class MatplotlibGraphs:
     plt.rcParams["figure.dpi"] = 100
     plt.rcParams["savefig.dpi"] = 100
     plt.rcParams["legend.loc"] = 'upper left'
+    # most samples drawn per time series, twice the figure width in pixels, 0 draws every sample
+    points = 3000
+    downsample = 'minmax'
+    # any of png, pdf and html, see ReportWriter
+    formats = ('png',)
 
     @staticmethod
-    def line_summary(df, field, title, y, x='Date/Time', interval=60, output='output', diff=False):
+    def configure(points=3000, downsample='minmax', formats=('png',)):
+        MatplotlibGraphs.points = points
+        MatplotlibGraphs.downsample = downsample
+        MatplotlibGraphs.formats = tuple(formats)
+
+    @staticmethod
+    def render(method, kwargs):
+        # entry point for chart jobs run in worker processes, returns the page handed to a ReportWriter
+        page = getattr(MatplotlibGraphs, method)(**kwargs)
+        plt.close('all')
+        return page
+
+    @staticmethod
+    def save(fig, output, title):
+        """
+        Encode a finished figure once for each configured format, then close it. The PNG bytes are
+        written to output and, for an HTML bundle, returned with the page. A PDF bundle gets the pickled
+        figure so the process writing the PDF can draw it again as vector graphics. bytes is the size of
+        what was written to output here.
+        """
+        formats = MatplotlibGraphs.formats
+        page = {'title': title, 'png': None, 'figure': None, 'bytes': 0}
+        if 'png' in formats or 'html' in formats:
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format='png')
+            if 'png' in formats:
+                with open(os.path.join(output, title.replace(' ', '_') + '.png'), 'wb') as file:
+                    page['bytes'] = file.write(buffer.getvalue())
+            if 'html' in formats:
+                page['png'] = buffer.getvalue()
+        if 'pdf' in formats:
+            page['figure'] = pickle.dumps(fig)
+        plt.close(fig)
+        return page
+
+    @staticmethod
+    def thin(data):
+        # samples beyond what the figure can show only cost render time, stacks are thinned on their total
+        points = MatplotlibGraphs.points
+        if not points or len(data) <= points:
+            return data
+        values = data.sum(axis=1) if isinstance(data, pd.DataFrame) else data
+        return data.iloc[Downsample.indices(data.index.asi8, values.to_numpy(), points,
+                                            method=MatplotlibGraphs.downsample)]
+
+    @staticmethod
+    def rollup(df, fields):
+        # charts read from a shared Rollup, a plain DataFrame is rolled up for just the fields needed
+        if isinstance(df, Rollup):
+            return df
+        return Rollup(df, fields=fields)
+
+    @staticmethod
+    def minute_axis(ax, interval):
+        ax.xaxis.set_major_locator(dates.MinuteLocator(interval=interval))
+        # matplotlib widens a single timestamp to years either side, far too many minute ticks to draw
+        x0, x1 = ax.dataLim.intervalx
+        if x0 == x1:
+            ax.set_xlim(x0 - interval / 2 / 24 / 60, x1 + interval / 2 / 24 / 60)
+
+    @staticmethod
+    def line_summary(df, field, title, y, x='Date/Time', interval=60, output='output', diff=False, scale=1):
         fig, ax = plt.subplots(1, 1, sharex='all', sharey='all')
 
-        grp = df.groupby(df.index)[field].sum().reset_index()
-        grp.set_index(['timestamp'], inplace=True)
-        if diff:
-            grp[field] = grp[field].diff()
-            grp = grp.apply(pd.Series.replace, to_replace=np.nan, value=0)
-            grp[grp[field] < 0] = 0
-            percentile = grp[field].quantile(0.9)
-            grp[field].clip(0, percentile, inplace=True)
+        grp = MatplotlibGraphs.thin(MatplotlibGraphs.rollup(df, [field]).series(field, diff=diff) / scale)
 
-        ax.plot(grp.index, grp[field], color='r')
+        ax.plot(grp.index, grp, color='r')
 
         for tick in ax.get_xticklabels():
             tick.set_rotation(45)
             tick.set_horizontalalignment("right")
 
-        ax.xaxis.set_major_locator(dates.MinuteLocator(interval=interval))
+        MatplotlibGraphs.minute_axis(ax, interval)
         ax.xaxis.set_major_formatter(DateFormatter('%H:%M:%S'))
         ax.tick_params(which='major', labelsize=5)
 
         fig.suptitle(title, fontsize=8)
         plt.xlabel(x, fontsize=6)
         plt.ylabel(y, fontsize=6)
-        title = title.replace(' ', '_')
-        plt.savefig(output + "/" + title)
+        return MatplotlibGraphs.save(fig, output, title)
 
     @staticmethod
-    def line_detail(df, fields, title, y, x='Date/Time', interval=60, output='output', diff=False):
+    def line_detail(df, fields, title, y, x='Date/Time', interval=60, output='output', diff=False, scale=1):
         fig, ax = plt.subplots(1, 1, sharex='all', sharey='all')
 
+        rollup = MatplotlibGraphs.rollup(df, fields)
         for i, field in enumerate(fields):
-            grp = df.groupby(df.index)[field].sum().reset_index()
-            grp.set_index(['timestamp'], inplace=True)
-            if diff:
-                grp[field] = grp[field].diff()
-                grp = grp.apply(pd.Series.replace, to_replace=np.nan, value=0)
-                grp[grp[field] < 0] = 0
-                percentile = grp[field].quantile(0.9)
-                grp[field].clip(0, percentile, inplace=True)
-            ax.plot(grp.index, grp[field], label=field)
+            grp = MatplotlibGraphs.thin(rollup.series(field, diff=diff) / scale)
+            ax.plot(grp.index, grp, label=field)
 
         for tick in ax.get_xticklabels():
             tick.set_rotation(45)
             tick.set_horizontalalignment("right")
 
-        ax.xaxis.set_major_locator(dates.MinuteLocator(interval=interval))
+        MatplotlibGraphs.minute_axis(ax, interval)
         ax.xaxis.set_major_formatter(DateFormatter('%H:%M:%S'))
         ax.tick_params(which='major', labelsize=5)
 
@@ -71,24 +133,13 @@ class MatplotlibGraphs:
         plt.xlabel(x, fontsize=6)
         plt.ylabel(y, fontsize=6)
         plt.legend()
-        title = title.replace(' ', '_')
-        plt.savefig(output + "/" + title)
+        return MatplotlibGraphs.save(fig, output, title)
 
     @staticmethod
-    def stack_summary(df, fields, title, y, x='Date/Time', interval=60, output='output', diff=False):
+    def stack_summary(df, fields, title, y, x='Date/Time', interval=60, output='output', diff=False, scale=1):
         fig, ax = plt.subplots(1, 1, sharex='all', sharey='none')
 
-        df2 = pd.DataFrame()
-        for i, field in enumerate(fields):
-            grp = df.groupby(df.index)[field].sum().reset_index()
-            grp.set_index(['timestamp'], inplace=True)
-            if diff:
-                grp[field] = grp[field].diff()
-                grp = grp.apply(pd.Series.replace, to_replace=np.nan, value=0)
-                grp[grp[field] < 0] = 0
-                percentile = grp[field].quantile(0.9)
-                grp[field].clip(0, percentile, inplace=True)
-            df2[field] = grp[field]
+        df2 = MatplotlibGraphs.thin(MatplotlibGraphs.rollup(df, fields).frame(fields, diff=diff) / scale)
 
         ax.stackplot(df2.index, df2.T, labels=fields)
 
@@ -96,7 +147,7 @@ class MatplotlibGraphs:
             tick.set_rotation(45)
             tick.set_horizontalalignment("right")
 
-        ax.xaxis.set_major_locator(dates.MinuteLocator(interval=interval))
+        MatplotlibGraphs.minute_axis(ax, interval)
         ax.xaxis.set_major_formatter(DateFormatter('%H:%M:%S'))
         ax.tick_params(which='major', labelsize=5)
 
@@ -104,62 +155,85 @@ class MatplotlibGraphs:
         plt.xlabel(x, fontsize=6)
         plt.ylabel(y, fontsize=6)
         plt.legend()
-        title = title.replace(' ', '_')
-        plt.savefig(output + "/" + title)
+        return MatplotlibGraphs.save(fig, output, title)
+
+    @staticmethod
+    def state_segments(df, fields):
+        """
+        Run-length encode the state of every fields[0] group (e.g. proc), see StateSegments. Returns one
+        row per segment: row (y position), key, state, start (date number) and width (days).
+        """
+        return MatplotlibGraphs.position_segments(StateSegments(fields).add(df).frame())
+
+    @staticmethod
+    def position_segments(segments):
+        # StateSegments.frame() placed for broken_barh, one row per key in key order
+        keys = segments['key'].to_numpy()
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        starts = segments['start'].to_numpy()
+        return pd.DataFrame({'row': np.cumsum(first) - 1,
+                             'key': keys,
+                             'state': segments['state'].to_numpy(),
+                             'start': mdates.date2num(starts),
+                             # seconds to days in the same steps as the loop this replaced, so widths match exactly
+                             'width': (segments['end'].to_numpy() - starts) / np.timedelta64(1, 's') / 60 / 60 / 24})
+
+    @staticmethod
+    def line_compare(runs, field, title, y, x='Elapsed (minutes)', output='output', diff=False, scale=1):
+        # runs maps a label to the Rollup of a profiler run, each drawn against the time since its first sample
+        fig, ax = plt.subplots(1, 1, sharex='all', sharey='all')
+
+        for label, rollup in runs.items():
+            grp = MatplotlibGraphs.thin(rollup.series(field, diff=diff) / scale)
+            elapsed = (grp.index - rollup.sums.index[0]).total_seconds() / 60
+            ax.plot(elapsed, grp.to_numpy(), label=label)
+
+        ax.tick_params(which='major', labelsize=5)
+
+        fig.suptitle(title, fontsize=8)
+        plt.xlabel(x, fontsize=6)
+        plt.ylabel(y, fontsize=6)
+        plt.legend()
+        return MatplotlibGraphs.save(fig, output, title)
+
+    @staticmethod
+    def table(df, title, output='output'):
+        fig, ax = plt.subplots(1, 1)
+        ax.axis('off')
+
+        tbl = ax.table(cellText=df.to_numpy(), rowLabels=list(df.index), colLabels=list(df.columns), loc='center')
+        tbl.auto_set_font_size(False)
+        tbl.set_fontsize(7)
+
+        fig.suptitle(title, fontsize=8)
+        return MatplotlibGraphs.save(fig, output, title)
 
     @staticmethod
     def broken_barh(df, fields, title, y, x='Date/Time', interval=60, output='output', barh_type='cpu'):
-        index = df.index.drop_duplicates()
-        resolution = (index[1:] - index[:-1]).value_counts()
+        # accepts the process frame or the output of state_segments
+        segments = df if 'width' in df.columns else MatplotlibGraphs.state_segments(df, fields)
 
         fig, ax = plt.subplots(1, 1)
-        yaxis = 0
-        ylabels = []
-        legend_pool = []
-
-        grp = df.groupby(fields[0])
-        for key, item in grp:
-            ylabels.append("{} {}".format(y, key))
-            df2 = grp.get_group(key)
-            df2 = df2.reset_index().\
-                sort_values(['timestamp', fields[1]]).\
-                drop_duplicates(['timestamp', fields[1], fields[0]], keep='first').\
-                set_index(['timestamp'])
-            df2 = df2[~df2.index.duplicated(keep='first')]
-
-            prev_state = start_state = df2[fields[1]].iloc[0]
-            prev_dt = start_dt = df2.first_valid_index()
-            counter = 1
-            seconds = 0
-            for idx, row in df2.iterrows():
-                counter += 1
-                diff = idx - prev_dt
-                seconds += diff.total_seconds()
-                if diff > resolution.index[0] or prev_state != row[fields[1]]:
-                    colour, label = MatplotlibGraphs.barh_labels(state=start_state, label_type=barh_type)
-                    if label in legend_pool:
-                        prefix = '_'
-                    else:
-                        legend_pool.append(label)
-                        prefix = ''
-                    ax.broken_barh(xranges=[(mdates.date2num(start_dt), seconds / 60 / 60 / 24)],
-                                   yrange=(6 * (yaxis + 1), 5), facecolors=colour, label=prefix + label)
-                    start_state = row[fields[1]]
-                    start_dt = idx
-                    counter = 0
-                    seconds = 0
-                prev_state = row[fields[1]]
-                prev_dt = idx
-
-            colour, label = MatplotlibGraphs.barh_labels(state=start_state, label_type=barh_type)
-            if label in legend_pool:
-                prefix = '_'
-            else:
-                legend_pool.append(label)
-                prefix = ''
-            ax.broken_barh(xranges=[(mdates.date2num(start_dt), seconds / 60 / 60 / 24)],
-                           yrange=(6 * (yaxis + 1), 5), facecolors=colour, label=prefix + label)
-            yaxis += 1
+        ylabels = ["{} {}".format(y, key) for key in segments['key'][segments['row'].diff() != 0]]
+        yaxis = len(ylabels)
+
+        # one collection per legend entry rather than one artist per segment
+        styles = {state: MatplotlibGraphs.barh_labels(state=state, label_type=barh_type)
+                  for state in segments['state'].unique()}
+        labels = segments['state'].map(lambda state: styles[state][1]).to_numpy()
+        x0 = segments['start'].to_numpy()
+        x1 = x0 + segments['width'].to_numpy()
+        y0 = 6 * (segments['row'].to_numpy() + 1)
+        y1 = y0 + 5
+        for label in pd.unique(labels):
+            mask = labels == label
+            colour = next(colour for colour, name in styles.values() if name == label)
+            vertices = np.stack([np.column_stack([x0[mask], y0[mask]]), np.column_stack([x0[mask], y1[mask]]),
+                                 np.column_stack([x1[mask], y1[mask]]), np.column_stack([x1[mask], y0[mask]])],
+                                axis=1)
+            ax.add_collection(PolyCollection(vertices, facecolors=colour, label=label))
+        ax.autoscale_view()
 
         ax.set_yticks([3 + 6 * x for x in range(1, yaxis + 1)])
         ax.set_yticklabels(ylabels)
@@ -168,7 +242,7 @@ class MatplotlibGraphs:
             tick.set_rotation(45)
             tick.set_horizontalalignment("right")
 
-        ax.xaxis.set_major_locator(dates.MinuteLocator(interval=interval))
+        MatplotlibGraphs.minute_axis(ax, interval)
         ax.xaxis.set_major_formatter(DateFormatter('%H:%M:%S'))
         ax.tick_params(which='major', labelsize=5)
 
@@ -176,8 +250,7 @@ class MatplotlibGraphs:
         plt.xlabel(x, fontsize=6)
         plt.ylabel(y, fontsize=6)
         plt.legend()
-        title = title.replace(' ', '_')
-        plt.savefig(output + "/" + title)
+        return MatplotlibGraphs.save(fig, output, title)
 
     @staticmethod
     def barh_labels(state, label_type='cpu'):
@@ -207,7 +280,7 @@ class MatplotlibGraphs:
     def bar_detail(data, title, y, x='Date/Time', output='output'):
         columns = np.arange(len(data['columns']))
         width = 0.4
-        cmap = plt.cm.get_cmap('hsv', len(data))
+        cmap = plt.get_cmap('hsv', len(data))
         fig, ax = plt.subplots()
         i = 0
 
@@ -221,5 +294,4 @@ class MatplotlibGraphs:
         ax.set_xticks(columns + width / 2)
         ax.set_xticklabels(data['columns'])
         plt.legend()
-        title = title.replace(' ', '_')
-        plt.savefig(output + "/" + title)
+        return MatplotlibGraphs.save(fig, output, title)
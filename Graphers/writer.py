@@ -0,0 +1,52 @@
+import base64
+import html
+import os
+import pickle
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+
+
+class ReportWriter:
+    """
+    Bundles the pages returned by MatplotlibGraphs.render, in the order they are added, into one
+    multi-page PDF and/or one self contained HTML file with the PNGs inlined. Loose PNGs are written
+    by the charts themselves, so with only png requested this does nothing. Pages are written as they
+    arrive and not kept, so memory stays flat however many charts there are.
+    """
+    FORMATS = ['png', 'pdf', 'html']
+
+    def __init__(self, output, formats=('png',), name='report', title='Profiler Report'):
+        self.pdf = PdfPages(os.path.join(output, name + '.pdf')) if 'pdf' in formats else None
+        self.html = None
+        if 'html' in formats:
+            self.html = open(os.path.join(output, name + '.html'), 'w')
+            self.html.write('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>{0}</title>\n'
+                            '<style>body {{ font-family: sans-serif; }} img {{ max-width: 100%; }}</style>\n'
+                            '</head>\n<body>\n<h1>{0}</h1>\n'.format(html.escape(title)))
+
+    def add(self, page):
+        # returns the bytes added to the HTML, PDF pages share fonts written on close so are not counted
+        written = 0
+        if self.pdf is not None:
+            fig = pickle.loads(page['figure'])
+            self.pdf.savefig(fig)
+            plt.close(fig)
+        if self.html is not None:
+            written += self.html.write('<h2>{0}</h2>\n<img alt="{0}" src="data:image/png;base64,{1}">\n'.format(
+                html.escape(page['title']), base64.b64encode(page['png']).decode()))
+        return written
+
+    def close(self):
+        if self.pdf is not None:
+            self.pdf.close()
+            self.pdf = None
+        if self.html is not None:
+            self.html.write('</body>\n</html>\n')
+            self.html.close()
+            self.html = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
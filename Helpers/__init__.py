@@ -1,2 +1,10 @@
 from .helper import HelperFunctions
 from .helper import ProcessData
+from .helper import RowFilter
+from .rollup import Rollup
+from .cache import FrameCache
+from .follow import FollowState
+from .histogram import IOHistogram
+from .segments import StateSegments
+from .stages import Stages
+from .drilldown import TopProcesses
@@ -0,0 +1,108 @@
+import importlib.util
+import json
+import os
+from .helper import PARSER_VERSION
+
+
+class FrameCache:
+    """
+    Parsed and typed frames of a profiler file kept as uncompressed Arrow IPC files in a
+    <input>.cache directory next to it, so later runs can memory map them instead of parsing the
+    CSV again. The cache is only used while the input path, size, mtime and PARSER_VERSION match.
+    """
+    @staticmethod
+    def available():
+        # pyarrow is optional and slow to import, it is only loaded once a cache is read or written
+        return importlib.util.find_spec('pyarrow') is not None
+
+    @staticmethod
+    def directory(filename):
+        return filename + '.cache'
+
+    @staticmethod
+    def key(filename):
+        stat = os.stat(filename)
+        return {'path': os.path.abspath(filename), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                'parser_version': PARSER_VERSION}
+
+    @staticmethod
+    def valid(filename):
+        if not FrameCache.available():
+            return False
+        try:
+            with open(os.path.join(FrameCache.directory(filename), 'key.json')) as file:
+                return json.load(file) == FrameCache.key(filename)
+        except (OSError, ValueError):
+            return False
+
+    @staticmethod
+    def load(filename):
+        """Return {group: DataFrame or None} from a valid cache, otherwise None."""
+        if not FrameCache.valid(filename):
+            return None
+        try:
+            with open(os.path.join(FrameCache.directory(filename), 'groups.json')) as file:
+                groups = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        frames = {'process': None, 'cgroup': None}
+        for group in groups:
+            frames[group] = FrameCache.read_frame(filename, group)
+        return frames
+
+    @staticmethod
+    def load_frame(filename, name):
+        # a frame derived from the parsed data, e.g. a rollup, stored alongside it
+        if not FrameCache.valid(filename) or not os.path.exists(FrameCache.frame_path(filename, name)):
+            return None
+        return FrameCache.read_frame(filename, name)
+
+    @staticmethod
+    def save(filename, frames):
+        if not FrameCache.available():
+            return
+        directory = FrameCache.directory(filename)
+        os.makedirs(directory, exist_ok=True)
+        # invalidate first so a half written cache is never picked up, along with anything derived from it
+        for name in os.listdir(directory):
+            if name == 'key.json' or name.endswith('.arrow'):
+                os.remove(os.path.join(directory, name))
+
+        groups = []
+        for group, df in frames.items():
+            if df is not None:
+                FrameCache.write_frame(filename, group, df)
+                groups.append(group)
+
+        with open(os.path.join(directory, 'groups.json'), 'w') as file:
+            json.dump(groups, file)
+        with open(os.path.join(directory, 'key.json'), 'w') as file:
+            json.dump(FrameCache.key(filename), file)
+
+    @staticmethod
+    def save_frame(filename, name, df):
+        # only attached to a cache that is still valid, so it is dropped along with the parsed frames
+        if FrameCache.valid(filename):
+            FrameCache.write_frame(filename, name, df)
+
+    @staticmethod
+    def frame_path(filename, name):
+        return os.path.join(FrameCache.directory(filename), name + '.arrow')
+
+    @staticmethod
+    def read_frame(filename, name):
+        import pyarrow as pa
+        source = pa.memory_map(FrameCache.frame_path(filename, name))
+        df = pa.ipc.open_file(source).read_all().to_pandas(split_blocks=True)
+        return df.set_index('timestamp')
+
+    @staticmethod
+    def write_frame(filename, name, df):
+        import pyarrow as pa
+        path = FrameCache.frame_path(filename, name)
+        table = pa.Table.from_pandas(df.reset_index(), preserve_index=False)
+        with pa.OSFile(path + '.tmp', 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(path + '.tmp', path)
@@ -0,0 +1,82 @@
+import pandas as pd
+from .rollup import Rollup
+
+
+class TopProcesses:
+    """
+    The processes (unames) that drive CPU, RSS and I/O, ranked with a single groupby over the process
+    frame, and the per timestamp series of the top count of each for the stacked drill-down charts.
+    by='total' ranks on CPU time used, summed RSS samples and bytes read and written, by='peak' on the
+    highest CPU average, the highest RSS and the most bytes read and written between two samples. Only
+    the rows of the selected processes are grouped again, so tens of thousands of short lived pids cost
+    one pass.
+    """
+    # metric: (ranking column by total, ranking column by peak, fields drawn, cumulative counters)
+    METRICS = {'cpu': ('cpu_total', 'cpu_peak', ['avg_cpu'], False),
+               'rss': ('rss_total', 'rss_peak', ['rss_kb'], False),
+               'io': ('io_total', 'io_peak', ['rchar', 'wchar'], True)}
+
+    def __init__(self, df, count=10, by='total'):
+        self.count = count
+        self.ranking = TopProcesses.rank(df)
+        self.top = {metric: self.ranking.nlargest(count, columns[0 if by == 'total' else 1]).index
+                    for metric, columns in TopProcesses.METRICS.items()}
+        selected = self.top['cpu'].union(self.top['rss']).union(self.top['io'])
+        fields = [field for metric in TopProcesses.METRICS.values() for field in metric[2]]
+        # the one filter of the full frame, the categorical isin only compares codes
+        self.rows = df.loc[df['uname'].isin(selected).to_numpy(), fields + ['uname']]
+
+    @staticmethod
+    def rank(df):
+        stats = df.groupby('uname', observed=True).agg(
+            pid=('pid', 'first'), ppid=('ppid', 'first'), desc=('desc', 'first'), samples=('pid', 'size'),
+            cpu_peak=('avg_cpu', 'max'), cputime_min=('cputime', 'min'), cputime_max=('cputime', 'max'),
+            rss_peak=('rss_kb', 'max'), rss_total=('rss_kb', 'sum'), rchar_min=('rchar', 'min'),
+            rchar_max=('rchar', 'max'), wchar_min=('wchar', 'min'), wchar_max=('wchar', 'max'))
+        io_total = (stats['rchar_max'] - stats['rchar_min']) + (stats['wchar_max'] - stats['wchar_min'])
+        # the largest increase between consecutive samples of each process, frames are always in timestamp
+        # order so the grouped diff needs no sort. A process sampled once has no increase, a counter that
+        # went backwards none either
+        steps = df.groupby('uname', observed=True)[['rchar', 'wchar']].diff()
+        steps = pd.Series(steps['rchar'].to_numpy() + steps['wchar'].to_numpy(), index=df.index)
+        io_peak = steps.groupby(df['uname'], observed=True).max().fillna(0).clip(lower=0)
+        label = stats['pid'].astype(str) + ' ' + stats['desc'].astype(str)
+        # pids are reused, so tell processes apart by their parent when the pid and name match
+        duplicated = label.duplicated(keep=False)
+        label[duplicated] += ' (ppid ' + stats.loc[duplicated, 'ppid'].astype(str) + ')'
+        return pd.DataFrame({'label': label, 'pid': stats['pid'], 'desc': stats['desc'].astype(str),
+                             'samples': stats['samples'], 'cpu_total': stats['cputime_max'] - stats['cputime_min'],
+                             'cpu_peak': stats['cpu_peak'], 'rss_total': stats['rss_total'],
+                             'rss_peak': stats['rss_peak'], 'io_total': io_total,
+                             'io_peak': io_peak})
+
+    def rollup(self, metric, totals):
+        """
+        A Rollup with one column per top process of metric, in rank order, and Other for the rest of
+        totals (the Rollup of every process). Counters are turned into per sample increases here, as
+        Rollup's clipping would flatten a process that only runs for part of the report.
+        """
+        fields, cumulative = TopProcesses.METRICS[metric][2:]
+        unames = self.top[metric]
+        rows = self.rows[self.rows['uname'].isin(unames).to_numpy()]
+        values = rows[fields].sum(axis=1)
+        wide = values.groupby([rows.index, rows['uname']], observed=True).sum().unstack()
+        wide = wide.reindex(index=totals.sums.index, columns=unames)
+        total = totals.sums[fields].sum(axis=1)
+        if cumulative:
+            wide = wide.diff().clip(lower=0)
+            total = total.diff().clip(lower=0)
+        wide = wide.fillna(0)
+        wide.columns = list(self.ranking.loc[unames, 'label'])
+        wide['Other'] = (total.fillna(0) - wide.sum(axis=1)).clip(lower=0)
+        return Rollup.from_sums(wide)
+
+    def table(self):
+        # the selected processes, most CPU time first, formatted for MatplotlibGraphs.table
+        selected = self.ranking.loc[self.rows['uname'].unique()].sort_values('cpu_total', ascending=False)
+        return pd.DataFrame({'PID': selected['pid'].astype(str), 'Name': selected['desc'],
+                             'Samples': selected['samples'].astype(str),
+                             'CPU Time': selected['cpu_total'].map('{:.2f}'.format),
+                             'Peak CPU Avg': selected['cpu_peak'].map('{:.2f}'.format),
+                             'Peak RSS GBytes': (selected['rss_peak'] / (1024 * 1024)).map('{:.3f}'.format),
+                             'IO Kbytes': selected['io_total'].map('{:.0f}'.format)}).set_index('PID')
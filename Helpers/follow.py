@@ -0,0 +1,57 @@
+import os
+from .helper import CHUNK_SIZE
+from .helper import HelperFunctions
+from .helper import ProcessData
+from .histogram import IOHistogram
+from .rollup import Rollup
+from .segments import StateSegments
+
+
+class FollowState:
+    """
+    What --follow keeps between refreshes of a profiler file that is still being written: the byte
+    offset parsed so far, the process and cgroup rollups, the CPU state segments and the I/O size
+    counts. Each refresh only parses and segments the lines appended since the last one and never
+    keeps the process frame itself.
+    """
+    def __init__(self, filename, chunk_size=CHUNK_SIZE, row_filter=None):
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.row_filter = row_filter
+        self.offset = 0
+        self.process_rollup = None
+        self.cgroup_rollup = None
+        self.segments = StateSegments(['proc', 'state'])
+        self.io_histogram = IOHistogram()
+
+    def refresh(self):
+        """Parse the complete lines appended since the last refresh, returns the number of new rows."""
+        size = os.path.getsize(self.filename)
+        if size < self.offset:
+            # truncated or replaced, start again from the top
+            self.__init__(self.filename, chunk_size=self.chunk_size, row_filter=self.row_filter)
+        with open(self.filename, 'rb') as file:
+            limit = HelperFunctions.complete_length(file, size)
+        if limit <= self.offset:
+            return 0
+
+        frames = ProcessData.read_dataframes(self.filename, chunk_size=self.chunk_size, row_filter=self.row_filter,
+                                             offset=self.offset, limit=limit)
+        self.offset = limit
+
+        rows = 0
+        process_df = frames['process']
+        if process_df is not None:
+            rows += len(process_df)
+            self.process_rollup = FollowState.fold(self.process_rollup, process_df)
+            self.segments.add(process_df)
+            self.io_histogram.add(process_df)
+        cgroup_df = frames['cgroup']
+        if cgroup_df is not None:
+            rows += len(cgroup_df)
+            self.cgroup_rollup = FollowState.fold(self.cgroup_rollup, cgroup_df)
+        return rows
+
+    @staticmethod
+    def fold(rollup, df):
+        return Rollup(df) if rollup is None else rollup.update(df)
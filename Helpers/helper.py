@@ -1,6 +1,40 @@
+import concurrent.futures
+import csv
+import functools
+import io
 import pandas as pd
 import numpy as np
 import binascii as ba
+from .stages import Stages
+
+
+TIMESTAMP_FORMAT = '%Y/%m/%dT%H:%M:%S'
+# every line starts with a fixed width timestamp, so timestamps can be compared as raw bytes
+TIMESTAMP_WIDTH = 19
+# bump whenever the frames built from a profiler file change, it invalidates cached frames
+PARSER_VERSION = 5
+# bytes read from the profiler file per streaming chunk
+CHUNK_SIZE = 32 * 1024 * 1024
+
+# desc and state repeat a handful of values, so they are parsed straight into categoricals. The CPU
+# averages are per sample figures only ever drawn, so float32 holds them. The cumulative times stay
+# float64 as their increases are what get plotted, and so do rsize and wsize, which are binned by
+# IOHistogram and would slip into the bucket below when just above an edge in float32
+PROCESS_DTYPES = {'timestamp': str, 'desc': 'category', 'pid': 'int64', 'state': 'category', 'ppid': 'int64',
+                  'nthrds': 'int64', 'rss': 'int64', 'pagesize': 'int64', 'rss_kb': 'int64', 'pss_kb': 'int64',
+                  'vsize': 'float64', 'proc': 'int64', 'avg_cpu': 'float32', 'avg_usr': 'float32',
+                  'avg_sys': 'float32', 'secs': 'int64', 'cputime': 'float64', 'usrtime': 'float64',
+                  'systime': 'float64', 'rchar': 'int64', 'rbytes': 'int64', 'syscr': 'int64', 'rsize': 'float64',
+                  'wchar': 'int64', 'wbytes': 'int64', 'syscw': 'int64', 'wsize': 'float64'}
+CGROUP_DTYPES = {'timestamp': str, 'desc': str, 'tgids': 'int64', 'pids': 'int64', 'cache': 'int64', 'rss': 'int64',
+                 'mapped_file': 'int64', 'inactive_anon': 'int64', 'active_anon': 'int64', 'unevictable': 'int64',
+                 'tcache': 'int64', 'trss': 'int64'}
+
+# pd.cut style (left, right] buckets for read and write sizes, anything outside them counts as 0B
+IO_BINS = np.array([-1, 0, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072, 262144, 524288,
+                    1048576, 2097152, 4194304, 8388608])
+IO_LABELS = ['0B', '512B', '1K', '2K', '4K', '8K', '16K', '32K', '64K', '128K', '256K', '512K',
+             '1M', '2M', '4M', '8M']
 
 
 class HelperFunctions:
@@ -26,6 +60,177 @@ class HelperFunctions:
                             group_list.append(line)
         return group_list
 
+    @staticmethod
+    def is_cgroup(line):
+        return line.split(b",", 2)[1].split(b"/", 2)[1] == b'cgroup'
+
+    @staticmethod
+    def parse_lines(lines, dtypes):
+        # let the C parser write straight into typed columns rather than building lists of strings
+        df = pd.read_csv(io.BytesIO(b"\n".join(lines)), header=None, names=list(dtypes), dtype=dtypes,
+                         quoting=csv.QUOTE_NONE)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format=TIMESTAMP_FORMAT)
+        return df
+
+    @staticmethod
+    def route_lines(lines, row_filter=None):
+        process_lines = []
+        cgroup_lines = []
+        for line in lines:
+            line = line.strip(b"\0\r\n")
+            if len(line) > 0:
+                if row_filter is not None and not row_filter.in_window(line):
+                    continue
+                cgroup = HelperFunctions.is_cgroup(line)
+                if row_filter is not None and not row_filter.accept(line, cgroup):
+                    continue
+                if cgroup:
+                    cgroup_lines.append(line)
+                else:
+                    process_lines.append(line)
+        return process_lines, cgroup_lines
+
+    @staticmethod
+    def next_timestamp(file):
+        # timestamp of the next non-empty line in file, None at the end of the file
+        for line in file:
+            line = line.strip(b"\0\r\n")
+            if len(line) > 0:
+                return line[:TIMESTAMP_WIDTH]
+        return None
+
+    @staticmethod
+    def seek_timestamp(file, start, block=CHUNK_SIZE):
+        """
+        Binary search the time ordered profiler file for an offset within block bytes before the
+        first line stamped at or after start. The line the offset lands in is always earlier than
+        start and should be discarded.
+        """
+        low = 0
+        high = file.seek(0, 2)
+        while high - low > block:
+            middle = (low + high) // 2
+            file.seek(middle)
+            file.readline()
+            timestamp = HelperFunctions.next_timestamp(file)
+            if timestamp is None or timestamp >= start:
+                high = middle
+            else:
+                low = middle
+        file.seek(low)
+        if low > 0:
+            file.readline()
+        return low
+
+    @staticmethod
+    def complete_length(file, size):
+        # offset just past the last newline before size, anything after it may still be being written
+        position = size
+        while position > 0:
+            step = min(65536, position)
+            file.seek(position - step)
+            newline = file.read(step).rfind(b"\n")
+            if newline >= 0:
+                return position - step + newline + 1
+            position -= step
+        return 0
+
+    @staticmethod
+    def read_line_chunks(filename, chunk_size=CHUNK_SIZE, row_filter=None, offset=0, limit=None):
+        """
+        Stream the profiler file in chunk_size byte blocks, routing process and cgroup rows in a
+        single pass and yielding (process_lines, cgroup_lines) per block. Only one block is held in
+        memory at a time. With a row_filter the read starts near the start of its time window and
+        stops at the first block entirely past its end. offset and limit restrict the read to a byte
+        range of the file, as used when following a file that is still being written.
+        """
+        remainder = b""
+        with open(filename, 'rb') as file:
+            if offset > 0:
+                file.seek(offset)
+            elif row_filter is not None and row_filter.start is not None:
+                HelperFunctions.seek_timestamp(file, row_filter.start, block=chunk_size)
+            while True:
+                size = chunk_size if limit is None else min(chunk_size, limit - file.tell())
+                block = file.read(size) if size > 0 else b""
+                if not block:
+                    break
+                lines = (remainder + block).split(b"\n")
+                # the last line may be cut short, carry it over to the next block
+                remainder = lines.pop()
+                if row_filter is not None and row_filter.past_end(lines):
+                    remainder = b""
+                    break
+                yield HelperFunctions.route_lines(lines, row_filter=row_filter)
+        if remainder:
+            yield HelperFunctions.route_lines([remainder], row_filter=row_filter)
+
+
+class RowFilter:
+    """
+    Time window, step and pid filters applied to raw lines while they are routed, so rejected rows
+    are never split or typed. start and end are inclusive, desc keeps rows whose step / process name
+    contains any of the given strings and pid keeps process rows of the given pids (cgroup rows
+    have no pid and are kept).
+    """
+    def __init__(self, start=None, end=None, desc=None, pid=None):
+        self.start = RowFilter.timestamp_key(start)
+        self.end = RowFilter.timestamp_key(end)
+        self.desc = [name.encode() for name in desc] if desc else None
+        self.pid = {str(number).encode() for number in pid} if pid else None
+
+    @staticmethod
+    def timestamp_key(value):
+        if value is None:
+            return None
+        return pd.Timestamp(value).strftime(TIMESTAMP_FORMAT).encode()
+
+    def in_window(self, line):
+        timestamp = line[:TIMESTAMP_WIDTH]
+        if self.start is not None and timestamp < self.start:
+            return False
+        if self.end is not None and timestamp > self.end:
+            return False
+        return True
+
+    def accept(self, line, cgroup):
+        if self.desc is None and self.pid is None:
+            return True
+        fields = line.split(b",", 3)
+        if self.desc is not None and not any(name in fields[1] for name in self.desc):
+            return False
+        if self.pid is not None and not cgroup and fields[2] not in self.pid:
+            return False
+        return True
+
+    def past_end(self, lines):
+        # the file is time ordered, once the first line of a block is past the end so is the rest
+        if self.end is None:
+            return False
+        for line in lines:
+            line = line.strip(b"\0\r\n")
+            if len(line) > 0:
+                return line[:TIMESTAMP_WIDTH] > self.end
+        return False
+
+    def filter_frame(self, df):
+        # the same filter over an already built frame, e.g. one loaded from the cache. As with
+        # read_dataframes, a group with no matching rows is None
+        if df is None:
+            return None
+        mask = np.ones(len(df), dtype=bool)
+        if self.start is not None:
+            mask &= df.index >= pd.Timestamp(self.start.decode())
+        if self.end is not None:
+            mask &= df.index <= pd.Timestamp(self.end.decode())
+        if self.desc is not None:
+            desc = df['desc'].astype(str)
+            mask &= np.logical_or.reduce([desc.str.contains(name.decode(), regex=False).to_numpy()
+                                          for name in self.desc])
+        if self.pid is not None and 'pid' in df.columns:
+            mask &= df['pid'].isin([int(number) for number in self.pid]).to_numpy()
+        return df[mask] if mask.any() else None
+
 
 class ProcessData:
     """
@@ -64,59 +269,50 @@ class ProcessData:
     """
     @staticmethod
     def build_process_dataframe(group_list):
-        df = pd.DataFrame(data=[line.split(",") for line in group_list],
-                          columns=['timestamp', 'desc', 'pid', 'state', 'ppid', 'nthrds', 'rss',
-                                   'pagesize', 'rss_kb', 'pss_kb', 'vsize', 'proc',
-                                   'avg_cpu', 'avg_usr', 'avg_sys', 'secs', 'cputime', 'usrtime',
-                                   'systime', 'rchar', 'rbytes', 'syscr', 'rsize', 'wchar',
-                                   'wbytes', 'syscw', 'wsize'])
-
-        # Convert object to data types
-        dtype = {'timestamp': object, 'desc': str, 'pid': int, 'state': str, 'ppid': int, 'nthrds': int,
-                 'rss': 'int64', 'pagesize': 'int64', 'rss_kb': 'int64', 'pss_kb': 'int64', 'vsize': 'float64',
-                 'proc': int, 'avg_cpu': 'float64', 'avg_usr': 'float64',
-                 'avg_sys': 'float64', 'secs': 'int64', 'cputime': 'float64', 'usrtime': 'float64',
-                 'systime': 'float64', 'rchar': 'int64', 'rbytes': 'int64', 'syscr': 'int64', 'rsize': float,
-                 'wchar': 'int64', 'wbytes': 'int64', 'syscw': 'int64', 'wsize': float}
-        for idx, obj in dtype.items():
-            df[idx] = df[idx].astype(obj)
-
-        # Convert timestamp from %Y/%m/%dT%H:%M:%S to %Y/%m/%d-%H:%M:%S
-        df['timestamp'] = pd.to_datetime(df['timestamp'],
-                                         format='%Y/%m/%dT%H:%M:%S')  # .dt.strftime("%Y/%m/%d-%H:%M:%S")
+        df = HelperFunctions.parse_lines([line.encode() for line in group_list], PROCESS_DTYPES)
+        return ProcessData.finalise_process_dataframe(df)
 
+    @staticmethod
+    def finalise_process_dataframe(df):
         df.set_index(['timestamp'], inplace=True)
 
-        df['uname'] = df['pid'].apply(str) + ":" + df['desc'] + ":" + df['ppid'].apply(str)
-        df['uname'] = df['uname'].apply(lambda x: ba.hexlify(x.encode()).decode())
-
-        iobins = [-1, 0, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072, 262144, 524288,
-                  1048576, 2097152, 4194304, 8388608]
-        iolabels = ['0B', '512B', '1K', '2K', '4K', '8K', '16K', '32K', '64K', '128K', '256K', '512K',
-                    '1M', '2M', '4M', '8M']
-        df['rsize_bin'] = pd.cut(df['rsize'], bins=iobins, labels=iolabels)
-        df['wsize_bin'] = pd.cut(df['wsize'], bins=iobins, labels=iolabels)
-        df['rsize_bin'] = df['rsize_bin'].fillna('0B')
-        df['wsize_bin'] = df['wsize_bin'].fillna('0B')
+        # hexlify each pid:desc:ppid combination once rather than once per row
+        codes, keys = pd.MultiIndex.from_arrays([df['pid'], df['desc'], df['ppid']]).factorize()
+        unames = [ba.hexlify("{}:{}:{}".format(*key).encode()).decode() for key in keys]
+        df['uname'] = pd.Categorical.from_codes(codes, categories=unames)
 
-        # Convert rss from pages to kilobytes
-        df['rss_kb'] = df['rss'] * (df['pagesize'] / 1024)
+        # Convert rss from pages to kilobytes, page sizes are whole kilobytes so this stays an integer
+        df['rss_kb'] = df['rss'].to_numpy() * df['pagesize'].to_numpy() // 1024
         # Convert bytes to kilobytes
-        HelperFunctions.divide_by_zero(df, 'vsize', 1024)
-        HelperFunctions.divide_by_zero(df, 'rchar', 1024)
-        HelperFunctions.divide_by_zero(df, 'rbytes', 1024)
-        HelperFunctions.divide_by_zero(df, 'rsize', 1024)
-        HelperFunctions.divide_by_zero(df, 'wchar', 1024)
-        HelperFunctions.divide_by_zero(df, 'wbytes', 1024)
-        HelperFunctions.divide_by_zero(df, 'wsize', 1024)
+        for column in ['vsize', 'rchar', 'rbytes', 'rsize', 'wchar', 'wbytes', 'wsize']:
+            df[column] = df[column].to_numpy() / 1024
 
-        # next bit replace the following two lines, not sure why this version of Pandas (0.22.0) doesn't like it
-        # df.replace([np.inf, np.nan], 0, inplace=True)
-        df = df.apply(pd.Series.replace, to_replace=np.inf, value=0)
-        df = df.apply(pd.Series.replace, to_replace=np.nan, value=0)
+        # Replace inf and NaN with 0, only the float columns can hold them
+        for column in df.columns:
+            values = df[column].to_numpy()
+            if values.dtype.kind == 'f':
+                invalid = np.isnan(values) | (values == np.inf)
+                if invalid.any():
+                    df[column] = np.where(invalid, 0.0, values)
+
+        # ids and counters only take as many bits as their range in this chunk needs, concat upcasts
+        # chunks to a common type and Rollup sums them as int64
+        for column in df.columns:
+            if df[column].dtype == np.int64:
+                df[column] = pd.to_numeric(df[column], downcast='integer')
 
         return df
 
+    @staticmethod
+    def memory_usage(df):
+        """Type and MiB of every column of a frame, index included, largest first."""
+        usage = df.memory_usage(index=True, deep=True)
+        dtypes = df.dtypes.astype(str)
+        table = pd.DataFrame({'dtype': [str(df.index.dtype) if column == 'Index' else dtypes[column]
+                                        for column in usage.index],
+                              'MiB': usage.to_numpy() / (1024 * 1024)}, index=usage.index)
+        return table.sort_values('MiB', ascending=False)
+
     """
     CGROUP INFORMATION
     timestamp     = time and date
@@ -134,21 +330,11 @@ class ProcessData:
     """
     @staticmethod
     def build_cgroup_dataframe(group_list):
-        df = pd.DataFrame(data=[line.split(",") for line in group_list],
-                          columns=['timestamp', 'desc', 'tgids', 'pids', 'cache', 'rss', 'mapped_file',
-                                   'inactive_anon', 'active_anon', 'unevictable', 'tcache', 'trss'])
-
-        # Convert object to data types
-        dtype = {'timestamp': object, 'desc': str, 'tgids': int, 'pids': int, 'cache': 'int64', 'rss': 'int64',
-                 'mapped_file': 'int64', 'inactive_anon': 'int64', 'active_anon': 'int64', 'unevictable': 'int64',
-                 'tcache': 'int64', 'trss': 'int64'}
-        for idx, obj in dtype.items():
-            df[idx] = df[idx].astype(obj)
-
-        # Convert timestamp from %Y/%m/%dT%H:%M:%S to %Y/%m/%d-%H:%M:%S
-        df['timestamp'] = pd.to_datetime(df['timestamp'],
-                                         format='%Y/%m/%dT%H:%M:%S')  # .dt.strftime("%Y/%m/%d-%H:%M:%S")
+        df = HelperFunctions.parse_lines([line.encode() for line in group_list], CGROUP_DTYPES)
+        return ProcessData.finalise_cgroup_dataframe(df)
 
+    @staticmethod
+    def finalise_cgroup_dataframe(df):
         # Convert bytes to kilobytes
         HelperFunctions.divide_by_zero(df, 'cache', 1024)
         HelperFunctions.divide_by_zero(df, 'rss', 1024)
@@ -163,3 +349,73 @@ class ProcessData:
         df = df.apply(pd.Series.replace, to_replace=np.nan, value=0)
 
         return df
+
+    @staticmethod
+    def build_chunk(group, lines):
+        if group == "cgroup":
+            return ProcessData.finalise_cgroup_dataframe(HelperFunctions.parse_lines(lines, CGROUP_DTYPES))
+        return ProcessData.finalise_process_dataframe(HelperFunctions.parse_lines(lines, PROCESS_DTYPES))
+
+    @staticmethod
+    def stream_dataframes(filename, chunk_size=CHUNK_SIZE, row_filter=None):
+        for process_lines, cgroup_lines in HelperFunctions.read_line_chunks(filename, chunk_size=chunk_size,
+                                                                            row_filter=row_filter):
+            if process_lines:
+                yield "process", ProcessData.build_chunk("process", process_lines)
+            if cgroup_lines:
+                yield "cgroup", ProcessData.build_chunk("cgroup", cgroup_lines)
+
+    @staticmethod
+    def read_dataframes(filename, chunk_size=CHUNK_SIZE, row_filter=None, offset=0, limit=None, stages=None):
+        """
+        Both record types from a single scan of the file. The process and cgroup rows of each block
+        are built on their own threads while the next block is read and routed. With stages (a Stages)
+        the reading and routing of lines and the building of frames are recorded as two stages.
+        """
+        chunks = {"process": [], "cgroup": []}
+        pending = []
+        blocks = HelperFunctions.read_line_chunks(filename, chunk_size=chunk_size, row_filter=row_filter,
+                                                  offset=offset, limit=limit)
+        build = ProcessData.build_chunk
+        if stages is not None:
+            blocks = stages.iterate('read: lines', blocks, rows=lambda lines: len(lines[0]) + len(lines[1]))
+            build = functools.partial(Stages.timed, ProcessData.build_chunk)
+
+        def collect(group, future):
+            if stages is None:
+                chunks[group].append(future.result())
+                return
+            df, record = future.result()
+            stages.add('read: frames', record, rows=len(df))
+            chunks[group].append(df)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            for lines in blocks:
+                for group, future in pending:
+                    collect(group, future)
+                pending = [(group, executor.submit(build, group, group_lines))
+                           for group, group_lines in zip(("process", "cgroup"), lines) if group_lines]
+            for group, future in pending:
+                collect(group, future)
+        return {group: ProcessData.concat(frames) if frames else None for group, frames in chunks.items()}
+
+    @staticmethod
+    def read_dataframe(filename, group="process", chunk_size=CHUNK_SIZE, row_filter=None):
+        chunks = [chunk for chunk_group, chunk in ProcessData.stream_dataframes(filename, chunk_size=chunk_size,
+                                                                                 row_filter=row_filter)
+                  if chunk_group == group]
+        if not chunks:
+            return None
+        return ProcessData.concat(chunks)
+
+    @staticmethod
+    def concat(chunks):
+        # align the categories of every chunk so the concatenated columns stay categorical, sorted so
+        # that sorting on a column such as state still orders rows as the strings would
+        for column, dtype in chunks[0].dtypes.items():
+            if isinstance(dtype, pd.CategoricalDtype):
+                categories = pd.Index(np.concatenate([chunk[column].cat.categories for chunk in chunks])).unique()
+                categories = categories.sort_values()
+                for chunk in chunks:
+                    chunk[column] = chunk[column].cat.set_categories(categories)
+        return pd.concat(chunks)
@@ -0,0 +1,30 @@
+import numpy as np
+from .helper import IO_BINS
+from .helper import IO_LABELS
+
+
+class IOHistogram:
+    """
+    Counts of read and write sizes over the IO_LABELS buckets. Counts are added one frame or chunk
+    at a time, so the whole file never needs a per row bucket column and --follow can keep adding
+    to the same histogram.
+    """
+    def __init__(self):
+        self.read = np.zeros(len(IO_LABELS), dtype=np.int64)
+        self.write = np.zeros(len(IO_LABELS), dtype=np.int64)
+
+    @staticmethod
+    def bucket_counts(sizes):
+        # sizes in bytes, anything outside the buckets (including NaN) counts as 0B
+        codes = np.searchsorted(IO_BINS, sizes, side='left') - 1
+        codes[(codes < 0) | (codes >= len(IO_LABELS))] = 0
+        return np.bincount(codes, minlength=len(IO_LABELS))
+
+    def add(self, df):
+        # frames hold sizes in kilobytes, dividing by 1024 is exact so scaling back recovers the bytes
+        self.read += IOHistogram.bucket_counts(df['rsize'].to_numpy() * 1024)
+        self.write += IOHistogram.bucket_counts(df['wsize'].to_numpy() * 1024)
+        return self
+
+    def to_dict(self):
+        return {'columns': list(IO_LABELS), 'Read': self.read.tolist(), 'Write': self.write.tolist()}
@@ -0,0 +1,68 @@
+import pandas as pd
+
+
+class Rollup:
+    """
+    Per-timestamp sums of the metric columns of a process (or cgroup) DataFrame, computed with a
+    single groupby and shared by every chart. The diffed and clipped variants used for cumulative
+    counters are derived from the sums on first use and cached.
+    """
+    # identifiers that are numeric but meaningless when summed
+    IGNORE = ['pid', 'ppid', 'proc']
+
+    def __init__(self, df, fields=None):
+        if fields is None:
+            fields = df.select_dtypes('number').columns.drop(Rollup.IGNORE, errors='ignore')
+        self.sums = Rollup.widen(df.groupby(df.index)[list(fields)].sum())
+        self.diffs = {}
+
+    @staticmethod
+    def widen(sums):
+        # pandas hands back the sums of a downcast integer column in its narrow type whenever they fit,
+        # keep them int64 so folding in more rows cannot overflow
+        return sums.astype({column: 'int64' for column, dtype in sums.dtypes.items() if dtype.kind in 'iu'})
+
+    @classmethod
+    def from_sums(cls, sums, diffs=None):
+        rollup = cls.__new__(cls)
+        rollup.sums = sums
+        rollup.diffs = diffs or {}
+        return rollup
+
+    def subset(self, fields):
+        # a Rollup of just these fields, small enough to hand to another process
+        return Rollup.from_sums(self.sums[list(fields)],
+                                {field: series for field, series in self.diffs.items() if field in fields})
+
+    def update(self, df):
+        """
+        Fold in rows appended since the rollup was built. A timestamp split across the boundary is
+        summed, and the diffed series are rebuilt from the full sums so cumulative counters carry over.
+        """
+        sums = Rollup.widen(df.groupby(df.index)[list(self.sums.columns)].sum())
+        overlap = sums.index.intersection(self.sums.index)
+        if len(overlap) > 0:
+            self.sums.loc[overlap] += sums.loc[overlap]
+            sums = sums.drop(overlap)
+        self.sums = pd.concat([self.sums, sums])
+        if not self.sums.index.is_monotonic_increasing:
+            self.sums.sort_index(inplace=True)
+        self.diffs = {}
+        return self
+
+    def series(self, field, diff=False):
+        if not diff:
+            return self.sums[field]
+        if field not in self.diffs:
+            grp = self.sums[field].diff().fillna(0)
+            grp[grp < 0] = 0
+            percentile = grp.quantile(0.9)
+            self.diffs[field] = grp.clip(0, percentile)
+        return self.diffs[field]
+
+    def increase(self, field):
+        # total growth of a cumulative counter, ignoring drops when processes exit and without clipping
+        return self.sums[field].diff().clip(lower=0).sum()
+
+    def frame(self, fields, diff=False):
+        return pd.DataFrame({field: self.series(field, diff=diff) for field in fields})
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+
+class StateSegments:
+    """
+    Run-length encoded states of every fields[0] group (e.g. proc), one segment per run of the same
+    fields[1] (e.g. state), split wherever consecutive samples are further apart than the usual
+    sampling interval. Rows are added a frame at a time and only the new rows are segmented: the
+    finished segments, the open segment of each key and the samples of the newest timestamp (whose
+    rows may continue in the next frame) are all that is kept between frames.
+    """
+    def __init__(self, fields):
+        self.fields = fields
+        self.finished = []
+        # the last sample of each key's open segment, with the timestamp the segment started at
+        self.open = None
+        self.pending = None
+        # counts of the gaps between consecutive timestamps, in first seen order like value_counts
+        self.intervals = {}
+        self.last = None
+
+    @staticmethod
+    def samples(df, fields):
+        # one sample per key and timestamp sorted by key then timestamp, the lowest state wins as it always has
+        df2 = df[fields].reset_index().\
+            sort_values([fields[0], 'timestamp', fields[1]]).\
+            drop_duplicates([fields[0], 'timestamp'], keep='first')
+        timestamps = df2['timestamp'].to_numpy()
+        return pd.DataFrame({'key': df2[fields[0]].to_numpy(), 'timestamp': timestamps,
+                             'state': np.asarray(df2[fields[1]], dtype=object), 'start': timestamps})
+
+    def gap(self):
+        # with a single timestamp there is no interval, but then every key has one sample and nothing to split
+        if not self.intervals:
+            return np.timedelta64(0, 's')
+        return max(self.intervals, key=self.intervals.get).to_timedelta64()
+
+    def add(self, df):
+        index = df.index.drop_duplicates()
+        if self.last is not None:
+            index = index[index > self.last].insert(0, self.last)
+        for interval, count in (index[1:] - index[:-1]).value_counts().items():
+            self.intervals[interval] = self.intervals.get(interval, 0) + count
+        if len(index):
+            self.last = index[-1]
+
+        samples = StateSegments.samples(df, self.fields)
+        if self.pending is not None:
+            samples = pd.concat([self.pending, samples]).\
+                sort_values(['key', 'timestamp', 'state'], kind='stable').\
+                drop_duplicates(['key', 'timestamp'], keep='first')
+        newest = (samples['timestamp'] == self.last).to_numpy()
+        self.pending = samples[newest]
+        if not newest.all():
+            runs = self.runs(samples[~newest])
+            self.finished.append(runs.loc[~runs['last'], ['key', 'state', 'start', 'end']])
+            runs = runs[runs['last']]
+            self.open = pd.DataFrame({'key': runs['key'], 'timestamp': runs['end'], 'state': runs['state'],
+                                      'start': runs['start']})
+        return self
+
+    def runs(self, samples):
+        # segment samples carrying on from the open segments, last marks the segment still open for each key
+        if self.open is not None:
+            samples = pd.concat([self.open, samples]).sort_values(['key', 'timestamp'], kind='stable')
+        keys = samples['key'].to_numpy()
+        states = samples['state'].to_numpy()
+        timestamps = samples['timestamp'].to_numpy()
+        rows = len(samples)
+
+        first = np.ones(rows, dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        change = np.zeros(rows, dtype=bool)
+        change[1:] = (np.diff(timestamps) > self.gap()) | (states[1:] != states[:-1])
+        change &= ~first
+
+        # a segment runs up to the sample that broke it, or to the last sample of its key
+        starts = np.flatnonzero(first | change)
+        following = np.append(starts[1:], rows)
+        ends = np.where(np.append(change[starts[1:]], False), following, following - 1)
+
+        return pd.DataFrame({'key': keys[starts], 'state': states[starts],
+                             'start': samples['start'].to_numpy()[starts], 'end': timestamps[ends],
+                             'last': np.append(first[starts[1:]], True)})
+
+    def frame(self):
+        """Every segment so far, sorted by key then start, with the key, state, start and end timestamps."""
+        if self.pending is not None and len(self.pending):
+            runs = self.runs(self.pending)
+        elif self.open is not None:
+            runs = self.open.rename(columns={'timestamp': 'end'})
+        else:
+            runs = pd.DataFrame({'key': [], 'state': [], 'start': [], 'end': []})
+        segments = pd.concat(self.finished + [runs[['key', 'state', 'start', 'end']]], ignore_index=True)
+        return segments.sort_values(['key', 'start'], kind='stable', ignore_index=True)
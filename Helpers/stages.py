@@ -0,0 +1,85 @@
+import contextlib
+import json
+import os
+import resource
+import time
+
+
+class Stages:
+    """
+    Wall time, CPU time, peak RSS growth and row counts of each stage of a report, e.g. reading,
+    building frames, each aggregation and each chart, plus the bytes each chart wrote. Stages recorded
+    under the same name more than once, such as the chunks of a file, are added together. Records are
+    plain dicts so they can come back from worker processes and be written out as JSON.
+    """
+    def __init__(self):
+        self.records = {}
+
+    @staticmethod
+    def peak_rss_mb():
+        # VmHWM starts again at exec, unlike ru_maxrss which a child inherits from the process that forked it
+        try:
+            with open('/proc/self/status') as status:
+                for line in status:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    @staticmethod
+    def timed(function, *args, **kwargs):
+        """Call function, returns its value and a record with the CPU time of the calling thread only."""
+        wall, cpu, peak = time.perf_counter(), time.thread_time(), Stages.peak_rss_mb()
+        value = function(*args, **kwargs)
+        return value, Stages.record(wall, cpu, peak, time.thread_time())
+
+    @staticmethod
+    def record(wall, cpu, peak, cpu_now):
+        peak_now = Stages.peak_rss_mb()
+        return {'seconds': time.perf_counter() - wall, 'cpu_seconds': cpu_now - cpu, 'peak_rss_mb': peak_now,
+                'peak_rss_delta_mb': peak_now - peak, 'pid': os.getpid()}
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        """
+        Time the body of a with block, CPU time covers every thread of this process. The yielded dict
+        can be given a 'rows' count once it is known.
+        """
+        counts = {'rows': rows}
+        wall, cpu, peak = time.perf_counter(), time.process_time(), Stages.peak_rss_mb()
+        yield counts
+        self.add(name, Stages.record(wall, cpu, peak, time.process_time()), rows=counts['rows'])
+
+    def iterate(self, name, iterable, rows=None):
+        # time spent producing each item of iterable, rows(item) counts the rows it holds
+        iterator = iter(iterable)
+        while True:
+            try:
+                item, record = Stages.timed(next, iterator)
+            except StopIteration:
+                return
+            self.add(name, record, rows=rows(item) if rows else None)
+            yield item
+
+    def add(self, name, record, rows=None):
+        record = dict(record, rows=rows)
+        if name not in self.records:
+            self.records[name] = dict(record, stage=name, calls=1)
+            return
+        total = self.records[name]
+        for key in ('seconds', 'cpu_seconds', 'peak_rss_delta_mb', 'output_bytes'):
+            if key in record:
+                total[key] = total.get(key, 0) + record[key]
+        total['peak_rss_mb'] = max(total['peak_rss_mb'], record['peak_rss_mb'])
+        if rows is not None:
+            total['rows'] = (total['rows'] or 0) + rows
+        total['calls'] += 1
+
+    def summary(self):
+        # stages can nest, e.g. read holds read: lines and read: frames, so their times are not summed
+        return {'peak_rss_mb': Stages.peak_rss_mb(), 'stages': list(self.records.values())}
+
+    def write(self, filename):
+        with open(filename, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
@@ -0,0 +1,123 @@
+import argparse
+import concurrent.futures
+import glob
+import json
+import logging
+import os
+import time
+import traceback
+from report import generate_report
+from report import logger
+
+
+def warm_worker(points, downsample, formats):
+    # pandas and matplotlib are imported once per worker, only errors are logged from inside a report
+    import Helpers  # noqa: F401
+    from Graphers import MatplotlibGraphs as mg
+    mg.configure(points=points, downsample=downsample, formats=formats)
+    logger.setLevel(logging.WARNING)
+
+
+def run_report(filename, output, chunk_size, use_cache):
+    from Graphers import MatplotlibGraphs as mg
+
+    start = time.perf_counter()
+    result = {'input': filename, 'output': output, 'bytes': os.path.getsize(filename)}
+    try:
+        os.makedirs(output, exist_ok=True)
+        result['rows'] = generate_report(filename, output=output, chunk_size=chunk_size, use_cache=use_cache,
+                                         points=mg.points, downsample=mg.downsample, formats=mg.formats)
+        result['error'] = None
+    except Exception as err:
+        result['rows'] = 0
+        result['error'] = '{}: {}'.format(type(err).__name__, err)
+        result['traceback'] = traceback.format_exc()
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def find_inputs(patterns):
+    # directories are expanded to the files directly inside them, anything else is treated as a glob
+    inputs = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            names = [os.path.join(pattern, name) for name in sorted(os.listdir(pattern))]
+        else:
+            names = sorted(glob.glob(pattern))
+        inputs.extend(name for name in names if os.path.isfile(name))
+    return inputs
+
+
+def output_directories(inputs, output):
+    # one directory per input named after the file, numbered when two inputs share a name
+    directories = []
+    used = set()
+    for filename in inputs:
+        name = os.path.splitext(os.path.basename(filename))[0]
+        candidate = name
+        counter = 1
+        while candidate in used:
+            counter += 1
+            candidate = '{}_{}'.format(name, counter)
+        used.add(candidate)
+        directories.append(os.path.join(output, candidate))
+    return directories
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-i', '--input', required=True, action='append', type=str,
+                    help='Directory or glob of profiler files, may be repeated')
+    ap.add_argument('-o', '--output', default='output', type=str, help='Directory holding one directory per input')
+    ap.add_argument('-j', '--jobs', default=os.cpu_count(), type=int, help='Number of reports generated at once')
+    ap.add_argument('-c', '--chunk-size', default=32, type=int, help='MiB of each input file parsed per chunk')
+    ap.add_argument('--no-cache', action='store_true', help='Neither read nor write the parsed data caches')
+    ap.add_argument('--points', default=3000, type=int,
+                    help='Most samples drawn per time series line, 0 draws every sample')
+    ap.add_argument('--downsample', default='minmax', choices=['minmax', 'lttb'],
+                    help='How time series are thinned down to --points samples')
+    ap.add_argument('--format', action='append', choices=['png', 'pdf', 'html'],
+                    help='Output format, may be repeated, pdf and html write one report file per input')
+    ap.add_argument('--summary', type=str, help='Summary JSON file, defaults to summary.json in the output directory')
+    args = ap.parse_args()
+
+    inputs = find_inputs(args.input)
+    if not inputs:
+        logger.error('No input files found')
+        exit(99)
+    logger.info('Generating {} reports with {} workers'.format(len(inputs), args.jobs))
+
+    start = time.perf_counter()
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs, initializer=warm_worker,
+                                                initargs=(args.points, args.downsample,
+                                                          args.format or ['png'])) as executor:
+        futures = [executor.submit(run_report, filename, output, args.chunk_size * 1024 * 1024, not args.no_cache)
+                   for filename, output in zip(inputs, output_directories(inputs, args.output))]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result['error']:
+                logger.error('{} failed: {}'.format(result['input'], result['error']))
+            else:
+                logger.info('{} done in {:.2f}s'.format(result['input'], result['seconds']))
+    seconds = time.perf_counter() - start
+
+    failures = [result for result in results if result['error']]
+    total_bytes = sum(result['bytes'] for result in results)
+    summary = {'files': len(results), 'succeeded': len(results) - len(failures), 'failed': len(failures),
+               'seconds': seconds, 'bytes': total_bytes, 'rows': sum(result['rows'] for result in results),
+               'files_per_second': len(results) / seconds, 'mb_per_second': total_bytes / 1024 / 1024 / seconds,
+               'failures': [{'input': result['input'], 'error': result['error'], 'traceback': result['traceback']}
+                            for result in failures],
+               'reports': sorted(results, key=lambda result: result['input'])}
+    os.makedirs(args.output, exist_ok=True)
+    summary_file = args.summary or os.path.join(args.output, 'summary.json')
+    with open(summary_file, 'w') as file:
+        json.dump(summary, file, indent=2)
+    logger.info('{} of {} reports generated in {:.2f}s, summary written to {}'.format(
+        summary['succeeded'], summary['files'], seconds, summary_file))
+
+
+if __name__ == '__main__':
+    main()
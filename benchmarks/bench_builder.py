@@ -0,0 +1,105 @@
+"""
+Rows/sec and peak RSS of turning a process profile into the typed process DataFrame.
+
+    python -m benchmarks.bench_builder --rows 10000000
+
+'legacy' is the original list-of-lines reader and per-column builder, 'streaming' is the chunked
+reader with the vectorised builder. Each implementation runs in its own interpreter so the peak
+RSS figures do not bleed into each other.
+"""
+import argparse
+import binascii as ba
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from Helpers import HelperFunctions
+from Helpers import ProcessData
+from Helpers import Stages
+from benchmarks.synthetic import write_profile
+
+
+def legacy_build_process_dataframe(group_list):
+    df = pd.DataFrame(data=[line.split(",") for line in group_list],
+                      columns=['timestamp', 'desc', 'pid', 'state', 'ppid', 'nthrds', 'rss',
+                               'pagesize', 'rss_kb', 'pss_kb', 'vsize', 'proc',
+                               'avg_cpu', 'avg_usr', 'avg_sys', 'secs', 'cputime', 'usrtime',
+                               'systime', 'rchar', 'rbytes', 'syscr', 'rsize', 'wchar',
+                               'wbytes', 'syscw', 'wsize'])
+    dtype = {'timestamp': object, 'desc': str, 'pid': int, 'state': str, 'ppid': int, 'nthrds': int,
+             'rss': 'int64', 'pagesize': 'int64', 'rss_kb': 'int64', 'pss_kb': 'int64', 'vsize': 'float64',
+             'proc': int, 'avg_cpu': 'float64', 'avg_usr': 'float64',
+             'avg_sys': 'float64', 'secs': 'int64', 'cputime': 'float64', 'usrtime': 'float64',
+             'systime': 'float64', 'rchar': 'int64', 'rbytes': 'int64', 'syscr': 'int64', 'rsize': float,
+             'wchar': 'int64', 'wbytes': 'int64', 'syscw': 'int64', 'wsize': float}
+    for idx, obj in dtype.items():
+        df[idx] = df[idx].astype(obj)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format='%Y/%m/%dT%H:%M:%S')
+    df.set_index(['timestamp'], inplace=True)
+    df['uname'] = df['pid'].apply(str) + ":" + df['desc'] + ":" + df['ppid'].apply(str)
+    df['uname'] = df['uname'].apply(lambda x: ba.hexlify(x.encode()).decode())
+    iobins = [-1, 0, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072, 262144, 524288,
+              1048576, 2097152, 4194304, 8388608]
+    iolabels = ['0B', '512B', '1K', '2K', '4K', '8K', '16K', '32K', '64K', '128K', '256K', '512K',
+                '1M', '2M', '4M', '8M']
+    df['rsize_bin'] = pd.cut(df['rsize'], bins=iobins, labels=iolabels)
+    df['wsize_bin'] = pd.cut(df['wsize'], bins=iobins, labels=iolabels)
+    df['rsize_bin'] = df['rsize_bin'].fillna('0B')
+    df['wsize_bin'] = df['wsize_bin'].fillna('0B')
+    df['rss_kb'] = df['rss'] * (df['pagesize'] / 1024)
+    for column in ['vsize', 'rchar', 'rbytes', 'rsize', 'wchar', 'wbytes', 'wsize']:
+        HelperFunctions.divide_by_zero(df, column, 1024)
+    df = df.apply(pd.Series.replace, to_replace=np.inf, value=0)
+    df = df.apply(pd.Series.replace, to_replace=np.nan, value=0)
+    return df
+
+
+def build(implementation, filename):
+    if implementation == 'legacy':
+        return legacy_build_process_dataframe(HelperFunctions.read_csv(filename=filename, group="process"))
+    return ProcessData.read_dataframe(filename=filename, group="process")
+
+
+def run(implementation, filename):
+    start = time.perf_counter()
+    df = build(implementation, filename)
+    seconds = time.perf_counter() - start
+    print(json.dumps({'implementation': implementation, 'rows': len(df), 'seconds': seconds,
+                      'rows_per_sec': len(df) / seconds,
+                      'peak_rss_mb': Stages.peak_rss_mb()}))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-r', '--rows', default=10000000, type=int, help='Rows in the synthetic profile')
+    ap.add_argument('-f', '--file', type=str, help='Existing profiler file to use instead of a synthetic one')
+    ap.add_argument('--implementations', default='legacy,streaming', type=str,
+                    help='Comma separated list of legacy and streaming')
+    ap.add_argument('--run', type=str, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.run:
+        run(args.run, args.file)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = args.file
+        if filename is None:
+            filename = os.path.join(tmp, 'profile.csv')
+            write_profile(filename, args.rows)
+
+        print('{:<12}{:>12}{:>12}{:>14}{:>16}'.format('impl', 'rows', 'seconds', 'rows/sec', 'peak RSS MB'))
+        for implementation in args.implementations.split(','):
+            output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_builder', '--run', implementation,
+                                     '--file', filename], check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.splitlines()[-1])
+            print('{:<12}{:>12}{:>12.2f}{:>14.0f}{:>16.0f}'.format(implementation, result['rows'], result['seconds'],
+                                                                  result['rows_per_sec'], result['peak_rss_mb']))
+
+
+if __name__ == '__main__':
+    main()
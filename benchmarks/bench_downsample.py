@@ -0,0 +1,43 @@
+"""
+Render time and PNG size of a line chart against the number of aggregated timestamps, drawing
+every sample versus thinning to MatplotlibGraphs.points samples.
+
+    python -m benchmarks.bench_downsample --lengths 10000,100000,1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from Helpers import Rollup
+from Graphers import MatplotlibGraphs as mg
+
+
+def render(rollup, output, points, downsample):
+    mg.configure(points=points, downsample=downsample)
+    start = time.perf_counter()
+    mg.render('line_summary', dict(df=rollup, field='avg_cpu', title='Bench', y='CPU Avg', output=output))
+    return time.perf_counter() - start, os.path.getsize(os.path.join(output, 'Bench.png'))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--lengths', default='10000,100000,1000000', type=str, help='Comma separated series lengths')
+    ap.add_argument('--points', default=3000, type=int, help='Samples kept when thinning')
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    print('{:>10}{:>10}{:>12}{:>12}'.format('length', 'mode', 'seconds', 'png KB'))
+    with tempfile.TemporaryDirectory() as output:
+        for length in [int(length) for length in args.lengths.split(',')]:
+            index = pd.date_range('2024-01-01', periods=length, freq='s', name='timestamp')
+            rollup = Rollup.from_sums(pd.DataFrame({'avg_cpu': rng.gamma(2, 20, length)}, index=index))
+            for mode, points, downsample in [('all', 0, 'minmax'), ('minmax', args.points, 'minmax'),
+                                             ('lttb', args.points, 'lttb')]:
+                seconds, size = render(rollup, output, points, downsample)
+                print('{:>10}{:>10}{:>12.2f}{:>12.0f}'.format(length, mode, seconds, size / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Wall time, peak RSS and output size of every stage of a report over synthetic profiles, written as
+JSON so runs can be compared between commits.
+
+    python -m benchmarks.bench_report --rows 100000,1000000 --churn 0.05 --cgroups --json bench.json
+
+Each profile is reported on in its own interpreter, without the cache and with one process, and the
+stages are those generate_report records in report_stages.json: reading and routing lines, building
+the typed frames, each aggregation and each chart, with wall and CPU time, peak RSS and rows, and
+for charts the bytes of PNG and HTML they wrote.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.synthetic import write_profile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def directory_bytes(directory):
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+
+def run(filename, output, chunk_size, formats, points):
+    # the report's own stage instrumentation, imported here so every run pays its own import cost
+    import report
+    from Helpers import Stages
+
+    start = time.perf_counter()
+    rows = report.generate_report(filename, output=output, chunk_size=chunk_size, use_cache=False, points=points,
+                                  formats=formats)
+    seconds = time.perf_counter() - start
+    with open(os.path.join(output, 'report_stages.json')) as file:
+        stages = json.load(file)['stages']
+    return {'input': filename, 'input_bytes': os.path.getsize(filename), 'rows': rows,
+            'seconds': seconds,
+            'peak_rss_mb': Stages.peak_rss_mb(), 'output_bytes': directory_bytes(output), 'stages': stages}
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-r', '--rows', default='100000,1000000', type=str,
+                    help='Comma separated process row counts, one synthetic profile each')
+    ap.add_argument('-f', '--file', action='append', type=str, help='Existing profiler file to use, may be repeated')
+    ap.add_argument('-p', '--processes', default=100, type=int, help='Processes sampled per timestamp')
+    ap.add_argument('--cpus', default=16, type=int, help='Number of CPUs processes are spread over')
+    ap.add_argument('--interval', default=1, type=int, help='Seconds between samples')
+    ap.add_argument('-d', '--duration', type=int, help='Seconds of samples, overrides --rows')
+    ap.add_argument('--churn', default=0.05, type=float, help='Chance a process changes state and CPU per sample')
+    ap.add_argument('--cgroups', action='store_true', help='Add cgroup lines to the synthetic profiles')
+    ap.add_argument('-c', '--chunk-size', default=32, type=int, help='MiB of the input file parsed per chunk')
+    ap.add_argument('--format', action='append', choices=['png', 'pdf', 'html'], help='Output format, may be repeated')
+    ap.add_argument('--points', default=3000, type=int, help='Most samples drawn per time series line')
+    ap.add_argument('--json', type=str, help='Write the results to this file as well as printing a summary')
+    ap.add_argument('--run', type=str, help=argparse.SUPPRESS)
+    ap.add_argument('--output', type=str, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    formats = args.format or ['png']
+
+    if args.run:
+        print(json.dumps(run(args.run, args.output, args.chunk_size * 1024 * 1024, formats, args.points)))
+        return
+
+    results = {'commit': commit(), 'python': platform.python_version(), 'machine': platform.machine(),
+               'cpus': os.cpu_count(), 'parameters': vars(args), 'runs': []}
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = args.file or []
+        if not inputs:
+            for rows in [int(rows) for rows in args.rows.split(',')]:
+                filename = os.path.join(tmp, 'profile_{}.csv'.format(rows))
+                write_profile(filename, rows, processes=args.processes, cpus=args.cpus, interval=args.interval,
+                              duration=args.duration, churn=args.churn, cgroups=args.cgroups)
+                inputs.append(filename)
+
+        for filename in inputs:
+            output = tempfile.mkdtemp(dir=tmp)
+            command = [sys.executable, '-m', 'benchmarks.bench_report', '--run', filename, '--output', output,
+                       '--chunk-size', str(args.chunk_size), '--points', str(args.points)]
+            for name in formats:
+                command += ['--format', name]
+            stdout = subprocess.run(command, cwd=ROOT, check=True, capture_output=True, text=True).stdout
+            result = json.loads(stdout.splitlines()[-1])
+            results['runs'].append(result)
+
+            print('{} ({} rows, {:.1f} MB)'.format(os.path.basename(filename), result['rows'],
+                                                result['input_bytes'] / 1024 / 1024))
+            print('{:<52}{:>10}{:>10}{:>14}{:>10}{:>12}'.format('stage', 'seconds', 'cpu', 'peak RSS MB', 'rows',
+                                                                'output KB'))
+            for stage in result['stages']:
+                output_kb = '{:.0f}'.format(stage['output_bytes'] / 1024) if 'output_bytes' in stage else ''
+                print('{:<52}{:>10.3f}{:>10.3f}{:>14.0f}{:>10}{:>12}'.format(stage['stage'], stage['seconds'],
+                                                                             stage['cpu_seconds'],
+                                                                             stage['peak_rss_mb'],
+                                                                             stage['rows'] or '', output_kb))
+            print('{:<52}{:>10.3f}{:>10}{:>14.0f}{:>10}{:>12.0f}\n'.format(
+                'total', result['seconds'], '', result['peak_rss_mb'], '', result['output_bytes'] / 1024))
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Start-up time of the report command line, the wall time of a few short invocations and the slowest
+imports reported by python -X importtime.
+
+    python -m benchmarks.bench_startup --repeat 5 --max-ms 500
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMANDS = [('--version', [sys.executable, 'report.py', '--version']),
+            ('--help', [sys.executable, 'report.py', '--help']),
+            ('import report', [sys.executable, '-c', 'import report'])]
+
+
+def wall_ms(command, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def slowest_imports(count):
+    # importtime lines look like "import time:  self [us] | cumulative | imported package"
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import report'], cwd=ROOT,
+                            stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True, check=True).stderr
+    imports = []
+    for line in output.splitlines()[1:]:
+        _, cumulative, name = line.split('|')
+        imports.append((int(cumulative) / 1000, name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--repeat', default=5, type=int, help='Runs of each command, the median is reported')
+    ap.add_argument('--top', default=10, type=int, help='Number of slowest imports to list')
+    ap.add_argument('--max-ms', default=None, type=float, help='Exit with 1 if a median wall time exceeds this')
+    args = ap.parse_args()
+
+    print('{:>16}{:>12}'.format('command', 'median ms'))
+    failed = False
+    for label, command in COMMANDS:
+        ms = wall_ms(command, args.repeat)
+        failed = failed or (args.max_ms is not None and ms > args.max_ms)
+        print('{:>16}{:>12.1f}'.format(label, ms))
+
+    print('\n{:>12}  {}'.format('cumul. ms', 'import report'))
+    for ms, name in slowest_imports(args.top):
+        print('{:>12.1f}  {}'.format(ms, name))
+
+    if failed:
+        print('\nStart-up slower than {} ms'.format(args.max_ms))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import argparse
+import datetime
+import numpy as np
+import pandas as pd
+from Helpers.helper import CGROUP_DTYPES, PROCESS_DTYPES, TIMESTAMP_FORMAT
+
+
+def sticky(rng, last, draw, churn, count, processes):
+    """
+    count samples of a per process value that is redrawn with probability churn at every sample and
+    otherwise carries over from the previous one, starting from last (None for the first sample).
+    """
+    values = draw((count, processes))
+    changed = rng.random((count, processes)) < churn
+    if last is not None:
+        values[0] = np.where(changed[0], values[0], last)
+    changed[0] = True
+    # row of the most recent change of every cell, forward filled down each process column
+    rows = np.maximum.accumulate(np.where(changed, np.arange(count)[:, None], 0), axis=0)
+    return values[rows, np.arange(processes)]
+
+
+def cgroup_lines(rng, timestamps, steps, step, nthrds, rss):
+    # one line per step and sample, its memory follows the rss of the processes in the step
+    count = len(timestamps)
+    tgids = np.bincount(step, minlength=steps)
+    pids = np.stack([np.bincount(step, weights=sample, minlength=steps) for sample in nthrds]).astype('int64')
+    memory = np.stack([np.bincount(step, weights=sample, minlength=steps) for sample in rss]).astype('int64') * 4096
+    cache = rng.integers(10 ** 6, 10 ** 9, size=(count, steps))
+    df = pd.DataFrame({
+        'timestamp': np.repeat(timestamps, steps),
+        'desc': np.tile(np.array(['job/cgroup/step{}'.format(number) for number in range(steps)]), count),
+        'tgids': np.tile(tgids, count),
+        'pids': pids.ravel(),
+        'cache': cache.ravel(),
+        'rss': memory.ravel(),
+        'mapped_file': (cache // 8).ravel(),
+        'inactive_anon': (memory // 4).ravel(),
+        'active_anon': (memory - memory // 4).ravel(),
+        'unevictable': 0,
+        'tcache': cache.ravel(),
+        'trss': memory.ravel(),
+    }, columns=list(CGROUP_DTYPES))
+    return df.to_csv(header=False, index=False).splitlines()
+
+
+def write_profile(filename, rows, processes=100, cpus=16, interval=1, seed=0, duration=None, churn=1.0, steps=4,
+                  cgroups=False):
+    """
+    Write a synthetic process profile of roughly rows lines, one line per process per sample,
+    with cumulative I/O and CPU counters that grow monotonically like the real profiler output.
+    duration (seconds) sets the number of samples instead of rows. churn is the chance that a
+    process changes state and CPU between two samples, 1 redraws both at every sample. Processes
+    are spread over steps job steps, with cgroups every sample also gets one cgroup line per step.
+    """
+    rng = np.random.default_rng(seed)
+    samples = max(1, duration // interval if duration else rows // processes)
+    start = datetime.datetime(2024, 1, 1)
+    pids = np.arange(1000, 1000 + processes)
+    step = pids % steps
+    # cputime, rchar, rbytes, syscr, wchar, wbytes, syscw
+    counters = np.zeros((7, processes))
+    state, proc = None, None
+    block = max(1, 200000 // processes)
+
+    with open(filename, 'w') as file:
+        for first in range(0, samples, block):
+            count = min(block, samples - first)
+            timestamps = pd.date_range(start + datetime.timedelta(seconds=first * interval), periods=count,
+                                       freq='{}s'.format(interval)).strftime(TIMESTAMP_FORMAT)
+            increments = rng.integers(0, 4096, size=(7, count, processes)).astype('float64')
+            totals = counters[:, None, :] + np.cumsum(increments, axis=1)
+            counters = totals[:, -1, :]
+            cputime, rchar, rbytes, syscr, wchar, wbytes, syscw = (total.ravel() for total in totals)
+            size = count * processes
+            states = sticky(rng, state, lambda shape: rng.choice(np.array(['R', 'S', 'D', 'Z']),
+                                                                 p=[0.6, 0.3, 0.09, 0.01], size=shape),
+                            churn, count, processes)
+            procs = sticky(rng, proc, lambda shape: rng.integers(0, cpus, size=shape), churn, count, processes)
+            state, proc = states[-1], procs[-1]
+            nthrds = rng.integers(1, 64, size=(count, processes))
+            rss = rng.integers(1000, 1000000, size=(count, processes))
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                df = pd.DataFrame({
+                    'timestamp': np.repeat(timestamps, processes),
+                    'desc': np.tile(np.array(['job/step{}'.format(number) for number in step]), count),
+                    'pid': np.tile(pids, count),
+                    'state': states.ravel(),
+                    'ppid': 1,
+                    'nthrds': nthrds.ravel(),
+                    'rss': rss.ravel(),
+                    'pagesize': 4096,
+                    'rss_kb': 0,
+                    'pss_kb': 0,
+                    'vsize': rng.integers(10 ** 6, 10 ** 10, size=size),
+                    'proc': procs.ravel(),
+                    'avg_cpu': rng.random(size) * 100,
+                    'avg_usr': rng.random(size) * 50,
+                    'avg_sys': rng.random(size) * 50,
+                    'secs': np.repeat(np.arange(first, first + count) * interval, processes),
+                    'cputime': np.round(cputime / 100, 2),
+                    'usrtime': np.round(cputime / 200, 2),
+                    'systime': np.round(cputime / 200, 2),
+                    'rchar': rchar.astype('int64'),
+                    'rbytes': rbytes.astype('int64'),
+                    'syscr': syscr.astype('int64'),
+                    'rsize': rbytes / syscr,
+                    'wchar': wchar.astype('int64'),
+                    'wbytes': wbytes.astype('int64'),
+                    'syscw': syscw.astype('int64'),
+                    'wsize': wbytes / syscw,
+                }, columns=list(PROCESS_DTYPES))
+            if not cgroups:
+                df.to_csv(file, header=False, index=False, na_rep='nan', float_format='%.10g')
+                continue
+
+            # the reader expects timestamps in order, so each sample's cgroup lines follow its process lines
+            lines = np.array(df.to_csv(header=False, index=False, na_rep='nan', float_format='%.10g').splitlines()
+                             + cgroup_lines(rng, timestamps, steps, step, nthrds, rss), dtype=object)
+            order = np.argsort(np.concatenate([np.repeat(np.arange(count), processes),
+                                               np.repeat(np.arange(count), steps)]), kind='stable')
+            file.write('\n'.join(lines[order]) + '\n')
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-o', '--output', required=True, type=str, help='Output profiler file')
+    ap.add_argument('-r', '--rows', default=1000000, type=int, help='Approximate number of process rows')
+    ap.add_argument('-p', '--processes', default=100, type=int, help='Processes sampled per timestamp')
+    ap.add_argument('--cpus', default=16, type=int, help='Number of CPUs processes are spread over')
+    ap.add_argument('--interval', default=1, type=int, help='Seconds between samples')
+    ap.add_argument('-d', '--duration', type=int, help='Seconds of samples, overrides --rows')
+    ap.add_argument('--churn', default=1.0, type=float,
+                    help='Chance a process changes state and CPU between samples, 1 redraws them every sample')
+    ap.add_argument('--steps', default=4, type=int, help='Number of job steps the processes are spread over')
+    ap.add_argument('--cgroups', action='store_true', help='Also write one cgroup line per step and sample')
+    ap.add_argument('--seed', default=0, type=int, help='Random seed')
+    args = ap.parse_args()
+    write_profile(args.output, args.rows, processes=args.processes, cpus=args.cpus, interval=args.interval,
+                  seed=args.seed, duration=args.duration, churn=args.churn, steps=args.steps, cgroups=args.cgroups)
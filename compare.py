@@ -0,0 +1,113 @@
+import argparse
+import os
+import pandas as pd
+from Helpers import FrameCache
+from Helpers import Rollup
+from report import logger
+from report import read_frames
+from report import render_charts
+
+
+# (title, field, y label, diff, scale) of the overlaid charts
+COMPARE_CHARTS = [
+    ('Compare CPU Usage (Sum)', 'avg_cpu', 'CPU Avg', False, 1),
+    ('Compare CPU Time (Sum)', 'cputime', 'Time', True, 1),
+    ('Compare RSS Usage (Sum)', 'rss_kb', 'GBytes', False, 1024 * 1024),
+    ('Compare VSize Usage (Sum)', 'vsize', 'GBytes', False, 1024 * 1024),
+    ('Compare RChar Activity', 'rchar', 'Kbytes', True, 1),
+    ('Compare WChar Activity', 'wchar', 'Kbytes', True, 1),
+    ('Compare Bytes Read from Storage', 'rbytes', 'Kbytes', True, 1),
+    ('Compare Bytes Written to Storage', 'wbytes', 'Kbytes', True, 1),
+]
+
+
+def load_rollup(filename, chunk_size, use_cache=True):
+    # the per timestamp sums are cached next to the parsed frames so a run is only ever rolled up once
+    if use_cache:
+        sums = FrameCache.load_frame(filename, 'process_rollup')
+        if sums is not None:
+            logger.info('Reading cached rollup of ' + filename)
+            return Rollup.from_sums(sums)
+
+    frames = read_frames(filename, chunk_size=chunk_size, use_cache=use_cache)
+    logger.info('Aggregating per timestamp ' + filename)
+    rollup = Rollup(frames['process'])
+    if use_cache:
+        FrameCache.save_frame(filename, 'process_rollup', rollup.sums)
+    return rollup
+
+
+def delta_table(runs):
+    """Headline figures of every run, with the change against the first run as a percentage."""
+    rows = {}
+    for label, rollup in runs.items():
+        sums = rollup.sums
+        rows[label] = {
+            'Duration (minutes)': (sums.index[-1] - sums.index[0]).total_seconds() / 60,
+            'CPU Avg (mean)': sums['avg_cpu'].mean(),
+            'CPU Avg (peak)': sums['avg_cpu'].max(),
+            'CPU Time': rollup.increase('cputime'),
+            'RSS GBytes (mean)': sums['rss_kb'].mean() / (1024 * 1024),
+            'RSS GBytes (peak)': sums['rss_kb'].max() / (1024 * 1024),
+            'RChar Kbytes': rollup.increase('rchar'),
+            'WChar Kbytes': rollup.increase('wchar'),
+            'Storage Read Kbytes': rollup.increase('rbytes'),
+            'Storage Written Kbytes': rollup.increase('wbytes'),
+        }
+    table = pd.DataFrame(rows)
+    base = table.columns[0]
+    for label in table.columns[1:]:
+        baseline = table[base].where(table[base] != 0)
+        table['{} vs {} %'.format(label, base)] = (table[label] - baseline) / baseline * 100
+    return table
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-i', '--input', required=True, action='append', type=str,
+                    help='Profiler file, give two or more, the first is the baseline')
+    ap.add_argument('-l', '--label', action='append', type=str, help='Legend label of each input, in order')
+    ap.add_argument('-o', '--output', default='output', type=str, help='Directory the charts are written to')
+    ap.add_argument('-c', '--chunk-size', default=32, type=int, help='MiB of each input file parsed per chunk')
+    ap.add_argument('-j', '--jobs', default=1, type=int, help='Number of processes used to draw the charts')
+    ap.add_argument('--no-cache', action='store_true', help='Neither read nor write the parsed data caches')
+    ap.add_argument('--points', default=3000, type=int,
+                    help='Most samples drawn per time series line, 0 draws every sample')
+    ap.add_argument('--format', action='append', choices=['png', 'pdf', 'html'],
+                    help='Output format, may be repeated, pdf and html write one file holding every chart')
+    ap.add_argument('--downsample', default='minmax', choices=['minmax', 'lttb'],
+                    help='How time series are thinned down to --points samples')
+    args = ap.parse_args()
+
+    if len(args.input) < 2:
+        logger.error('At least two input files are needed to compare')
+        exit(99)
+    for filename in args.input:
+        if not os.path.exists(filename):
+            logger.error('Input file does not exist: ' + filename)
+            exit(99)
+    labels = args.label or [os.path.splitext(os.path.basename(filename))[0] for filename in args.input]
+    if len(labels) != len(args.input) or len(set(labels)) != len(labels):
+        logger.error('Give one unique label per input file')
+        exit(99)
+
+    runs = {label: load_rollup(filename, chunk_size=args.chunk_size * 1024 * 1024, use_cache=not args.no_cache)
+            for label, filename in zip(labels, args.input)}
+
+    os.makedirs(args.output, exist_ok=True)
+    table = delta_table(runs)
+    table.to_csv(os.path.join(args.output, 'Compare_Delta.csv'))
+    logger.info('Run comparison\n' + table.to_string(float_format='{:.2f}'.format))
+
+    jobs = [('Plotting ' + title, 'line_compare',
+             dict(runs={label: rollup.subset([field]) for label, rollup in runs.items()}, field=field, title=title,
+                  y=y, diff=diff, scale=scale, output=args.output))
+            for title, field, y, diff, scale in COMPARE_CHARTS]
+    jobs.append(('Plotting Compare Delta', 'table',
+                 dict(df=table.map('{:.2f}'.format), title='Compare Delta', output=args.output)))
+    render_charts(jobs, args.output, workers=args.jobs, points=args.points, downsample=args.downsample,
+                  formats=args.format or ['png'], name='compare')
+
+
+if __name__ == '__main__':
+    main()
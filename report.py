@@ -1,10 +1,11 @@
 import argparse
+import concurrent.futures
 import os
 import logging
-from Helpers import HelperFunctions
-from Helpers import ProcessData
-from Graphers import MatplotlibGraphs as mg
-from fpdf import FPDF
+import time
+
+# pandas, matplotlib and pyarrow are only imported by the functions that need them so that
+# --help, --version and bad arguments return straight away
 
 
 # setup logging
@@ -16,88 +17,336 @@ log_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(messa
 log_handler.setFormatter(log_format)
 logger.addHandler(log_handler)
 
-logger.info('Starting ...')
-
-# pull in arguments
-logger.info('Reading arguments')
-ap = argparse.ArgumentParser()
-ap.add_argument('-v', '--version', action='version', version='Version 1.0 - Superb Squid')
-ap.add_argument('-i', '--input', required=True, type=str, help='Input profiler file')
-args = ap.parse_args()
-
-# check that the input file exists if not exit
-if not os.path.exists(args.input):
-    logger.error('Input file does not exist')
-    exit(99)
-
-process_list = HelperFunctions.read_csv(filename=args.input, group="process")
-process_df = ProcessData.build_process_dataframe(group_list=process_list)
-process_list.clear()
-
-logger.info('Plotting CPU Usage (Sum)')
-mg.line_summary(df=process_df, field='avg_cpu', title='CPU Usage (Sum)', y='CPU Avg')
-
-logger.info('Plotting RSS Usage (Sum)')
-process_df['rss_orig'] = process_df['rss']
-process_df['rss'] = process_df['rss'] / (1024 * 1024)
-mg.line_summary(df=process_df, field='rss', title='RSS Usage (Sum)', y='GBytes')
-
-logger.info('Plotting CPU User & System Usage')
-mg.line_detail(df=process_df, fields=['avg_sys', 'avg_usr'], title='CPU User & System Usage', y='CPU Avg')
-
-logger.info('Plotting CPU User & System Stacked Usage')
-mg.stack_summary(df=process_df, fields=['avg_sys', 'avg_usr'], title='CPU User & System Stacked Usage', y='CPU Avg')
-
-logger.info('Plotting RSS & VSize Usage')
-process_df['vsize_orig'] = process_df['vsize']
-process_df['vsize'] = process_df['vsize'] / (1024 * 1024)
-mg.line_detail(df=process_df, fields=['rss', 'vsize'], title='RSS & VSize Usage', y='GBytes')
-
-logger.info('Plotting RSS & VSize Stacked Usage')
-mg.stack_summary(df=process_df, fields=['rss', 'vsize'], title='RSS & VSize Stacked Usage', y='GBytes')
-
-logger.info('Plotting RChar & WChar Activity')
-mg.line_detail(df=process_df, fields=['rchar', 'wchar'], title='IO Activity', y='Kbytes', diff=True)
-
-logger.info('Plotting RChar & WChar Stacked Activity')
-mg.stack_summary(df=process_df, fields=['rchar', 'wchar'], title='IO Stacked Activity', y='Kbytes', diff=True)
-
-logger.info('Plotting RBytes & WBytes Activity')
-mg.line_detail(df=process_df, fields=['rbytes', 'wbytes'], title='Bytes Read & Written to Storage',
-               y='Kbytes', diff=True)
-
-logger.info('Plotting RBytes & WBytes Stacked Activity')
-mg.stack_summary(df=process_df, fields=['rbytes', 'wbytes'], title='Stacked Bytes Read & Written to Storage',
-               y='Kbytes', diff=True)
-
-logger.info('Plotting Read & Write System Call Activity')
-mg.line_detail(df=process_df, fields=['syscr', 'syscw'], title='Read & Write System Call Activity',
-               y='#System Calls', diff=True)
-
-logger.info('Plotting Read & Write System Call Stacked Activity')
-mg.stack_summary(df=process_df, fields=['syscr', 'syscw'], title='Read & Write System Call Stacked Activity',
-                 y='#System Calls', diff=True)
-
-logger.info('Plotting Read & Write Sizes')
-mg.line_detail(df=process_df, fields=['rsize', 'wsize'], title='Read & Write Sizes', y='Kbytes')
-
-logger.info('Plotting CPU Time (Sum)')
-mg.line_summary(df=process_df, field='cputime', title='CPU Time (Sum)', y='Time', diff=True)
-
-logger.info('Plotting CPU Process State')
-mg.broken_barh(df=process_df, fields=['proc', 'state'], title='CPU Process State', y='CPU')
-
-read_dict = process_df['rsize_bin'].value_counts().to_dict()
-write_dict = process_df['wsize_bin'].value_counts().to_dict()
-read_list = []
-write_list = []
-io_dict = dict()
-io_dict['columns'] = ['0B', '512B', '1K', '2K', '4K', '8K', '16K', '32K', '64K', '128K', '256K', '512K',
-                      '1M', '2M', '4M', '8M']
-for key in io_dict['columns']:
-    read_list.append(read_dict[key]) if key in read_dict else read_list.append(0)
-    write_list.append(write_dict[key]) if key in write_dict else write_list.append(0)
-io_dict['Read'] = read_list
-io_dict['Write'] = write_list
-logger.info('Plotting I/O Distribution')
-mg.bar_detail(data=io_dict, title='IO Distribution', y='IO Frequency', x='IO Sizes')
+
+def chart_jobs(process_rollup, segments, io_dict, cgroup_rollup=None, output='output', top_processes=None):
+    """
+    Every chart in the report as (log message, MatplotlibGraphs method, keyword arguments). Jobs only
+    carry the rolled up columns or state segments they plot so they are cheap to send to a worker.
+    """
+    def rollup(*fields):
+        return process_rollup.subset(fields)
+
+    jobs = [
+        ('Plotting CPU Usage (Sum)', 'line_summary',
+         dict(df=rollup('avg_cpu'), field='avg_cpu', title='CPU Usage (Sum)', y='CPU Avg')),
+        ('Plotting RSS Usage (Sum)', 'line_summary',
+         dict(df=rollup('rss'), field='rss', title='RSS Usage (Sum)', y='GBytes', scale=1024 * 1024)),
+        ('Plotting CPU User & System Usage', 'line_detail',
+         dict(df=rollup('avg_sys', 'avg_usr'), fields=['avg_sys', 'avg_usr'], title='CPU User & System Usage',
+              y='CPU Avg')),
+        ('Plotting CPU User & System Stacked Usage', 'stack_summary',
+         dict(df=rollup('avg_sys', 'avg_usr'), fields=['avg_sys', 'avg_usr'],
+              title='CPU User & System Stacked Usage', y='CPU Avg')),
+        ('Plotting RSS & VSize Usage', 'line_detail',
+         dict(df=rollup('rss', 'vsize'), fields=['rss', 'vsize'], title='RSS & VSize Usage', y='GBytes',
+              scale=1024 * 1024)),
+        ('Plotting RSS & VSize Stacked Usage', 'stack_summary',
+         dict(df=rollup('rss', 'vsize'), fields=['rss', 'vsize'], title='RSS & VSize Stacked Usage', y='GBytes',
+              scale=1024 * 1024)),
+        ('Plotting RChar & WChar Activity', 'line_detail',
+         dict(df=rollup('rchar', 'wchar'), fields=['rchar', 'wchar'], title='IO Activity', y='Kbytes',
+              diff=True)),
+        ('Plotting RChar & WChar Stacked Activity', 'stack_summary',
+         dict(df=rollup('rchar', 'wchar'), fields=['rchar', 'wchar'], title='IO Stacked Activity', y='Kbytes',
+              diff=True)),
+        ('Plotting RBytes & WBytes Activity', 'line_detail',
+         dict(df=rollup('rbytes', 'wbytes'), fields=['rbytes', 'wbytes'], title='Bytes Read & Written to Storage',
+              y='Kbytes', diff=True)),
+        ('Plotting RBytes & WBytes Stacked Activity', 'stack_summary',
+         dict(df=rollup('rbytes', 'wbytes'), fields=['rbytes', 'wbytes'],
+              title='Stacked Bytes Read & Written to Storage', y='Kbytes', diff=True)),
+        ('Plotting Read & Write System Call Activity', 'line_detail',
+         dict(df=rollup('syscr', 'syscw'), fields=['syscr', 'syscw'], title='Read & Write System Call Activity',
+              y='#System Calls', diff=True)),
+        ('Plotting Read & Write System Call Stacked Activity', 'stack_summary',
+         dict(df=rollup('syscr', 'syscw'), fields=['syscr', 'syscw'],
+              title='Read & Write System Call Stacked Activity', y='#System Calls', diff=True)),
+        ('Plotting Read & Write Sizes', 'line_detail',
+         dict(df=rollup('rsize', 'wsize'), fields=['rsize', 'wsize'], title='Read & Write Sizes', y='Kbytes')),
+        ('Plotting CPU Time (Sum)', 'line_summary',
+         dict(df=rollup('cputime'), field='cputime', title='CPU Time (Sum)', y='Time', diff=True)),
+        ('Plotting CPU Process State', 'broken_barh',
+         dict(df=segments, fields=['proc', 'state'],
+              title='CPU Process State', y='CPU')),
+        ('Plotting I/O Distribution', 'bar_detail',
+         dict(data=io_dict, title='IO Distribution', y='IO Frequency', x='IO Sizes')),
+    ]
+    if cgroup_rollup is not None:
+        jobs.extend(cgroup_jobs(cgroup_rollup))
+    if top_processes is not None:
+        jobs.extend(top_jobs(top_processes, process_rollup))
+    for message, method, kwargs in jobs:
+        kwargs['output'] = output
+    return jobs
+
+
+def cgroup_jobs(cgroup_rollup):
+    # cache, rss, tcache and trss are in kilobytes, mapped_file and the anon counters are still in bytes
+    def rollup(*fields):
+        return cgroup_rollup.subset(fields)
+
+    return [
+        ('Plotting Cgroup Cache & RSS Usage', 'line_detail',
+         dict(df=rollup('cache', 'rss'), fields=['cache', 'rss'], title='Cgroup Cache & RSS Usage', y='GBytes',
+              scale=1024 * 1024)),
+        ('Plotting Cgroup Cache & RSS Stacked Usage', 'stack_summary',
+         dict(df=rollup('cache', 'rss'), fields=['cache', 'rss'], title='Cgroup Cache & RSS Stacked Usage',
+              y='GBytes', scale=1024 * 1024)),
+        ('Plotting Cgroup Mapped File & Anonymous Usage', 'line_detail',
+         dict(df=rollup('mapped_file', 'inactive_anon', 'active_anon'),
+              fields=['mapped_file', 'inactive_anon', 'active_anon'], title='Cgroup Mapped File & Anonymous Usage',
+              y='GBytes', scale=1024 * 1024 * 1024)),
+        ('Plotting Cgroup Anonymous Stacked Usage', 'stack_summary',
+         dict(df=rollup('inactive_anon', 'active_anon'), fields=['inactive_anon', 'active_anon'],
+              title='Cgroup Anonymous Stacked Usage', y='GBytes', scale=1024 * 1024 * 1024)),
+        ('Plotting Cgroup TCache & TRSS Usage', 'line_detail',
+         dict(df=rollup('tcache', 'trss'), fields=['tcache', 'trss'], title='Cgroup TCache & TRSS Usage',
+              y='GBytes', scale=1024 * 1024)),
+    ]
+
+
+def top_jobs(top_processes, process_rollup):
+    # per process drill-down, each stack is the top processes of that metric plus everything else as Other
+    cpu = top_processes.rollup('cpu', process_rollup)
+    rss = top_processes.rollup('rss', process_rollup)
+    io = top_processes.rollup('io', process_rollup)
+    count = top_processes.count
+
+    return [
+        ('Plotting Top Processes CPU Usage', 'stack_summary',
+         dict(df=cpu, fields=list(cpu.sums.columns), title='Top {} Processes CPU Usage'.format(count), y='CPU Avg')),
+        ('Plotting Top Processes RSS Usage', 'stack_summary',
+         dict(df=rss, fields=list(rss.sums.columns), title='Top {} Processes RSS Usage'.format(count), y='GBytes',
+              scale=1024 * 1024)),
+        ('Plotting Top Processes IO Activity', 'stack_summary',
+         dict(df=io, fields=list(io.sums.columns), title='Top {} Processes IO Activity'.format(count),
+              y='Kbytes')),
+        ('Plotting Top Processes', 'table',
+         dict(df=top_processes.table(), title='Top Processes')),
+    ]
+
+
+def read_frames(filename, chunk_size, use_cache=True, rebuild_cache=False, row_filter=None, stages=None):
+    from Helpers import FrameCache
+    from Helpers import ProcessData
+    from Helpers import Stages
+
+    stages = stages if stages is not None else Stages()
+    if use_cache and not FrameCache.available():
+        logger.warning('pyarrow is not installed, parsed data will not be cached')
+        use_cache = False
+
+    if use_cache and not rebuild_cache:
+        with stages.stage('cache: read'):
+            frames = FrameCache.load(filename)
+        if frames is not None:
+            logger.info('Reading cached profiler data from ' + FrameCache.directory(filename))
+            if row_filter is not None:
+                with stages.stage('filter'):
+                    frames = {group: row_filter.filter_frame(df) for group, df in frames.items()}
+            return frames
+
+    logger.info('Reading profiler data')
+    with stages.stage('read') as counts:
+        frames = ProcessData.read_dataframes(filename=filename, chunk_size=chunk_size, row_filter=row_filter,
+                                             stages=stages)
+        counts['rows'] = sum(len(df) for df in frames.values() if df is not None)
+
+    # a filtered read only holds part of the file so it is never cached
+    if use_cache and row_filter is None:
+        logger.info('Caching profiler data in ' + FrameCache.directory(filename))
+        try:
+            with stages.stage('cache: write'):
+                FrameCache.save(filename, frames)
+        except OSError as err:
+            logger.warning('Unable to cache profiler data: {}'.format(err))
+    return frames
+
+
+def stage_table(stages):
+    # the appendix page, one row per recorded stage
+    import pandas as pd
+
+    return pd.DataFrame({record['stage']: {'Seconds': '{:.3f}'.format(record['seconds']),
+                                           'CPU Seconds': '{:.3f}'.format(record['cpu_seconds']),
+                                           'Peak RSS MB': '{:.0f}'.format(record['peak_rss_mb']),
+                                           'RSS Growth MB': '{:.0f}'.format(record['peak_rss_delta_mb']),
+                                           'Rows': '' if record['rows'] is None else str(record['rows'])}
+                         for record in stages.records.values()}).T
+
+
+def render_charts(jobs, output, workers=1, points=3000, downsample='minmax', formats=('png',), name='report',
+                  stages=None, appendix=False):
+    from Graphers import MatplotlibGraphs as mg
+    from Graphers import ReportWriter
+    from Helpers import Stages
+
+    def add(message, result):
+        # charts are timed where they are drawn, so a worker's time does not include waiting in the queue
+        page, record = result
+        written = page['bytes'] + writer.add(page)
+        if stages is not None:
+            stages.add('chart: ' + message.replace('Plotting ', ''), dict(record, output_bytes=written))
+
+    # every chart is drawn once, PDF and HTML bundles are assembled here from what the charts return
+    mg.configure(points=points, downsample=downsample, formats=formats)
+    with ReportWriter(output, formats=formats, name=name) as writer:
+        if workers <= 1:
+            for message, method, kwargs in jobs:
+                logger.info(message)
+                add(message, Stages.timed(mg.render, method, kwargs))
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=mg.configure,
+                                                        initargs=(points, downsample, formats)) as executor:
+                futures = []
+                for message, method, kwargs in jobs:
+                    logger.info(message)
+                    futures.append((message, executor.submit(Stages.timed, mg.render, method, kwargs)))
+                for message, future in futures:
+                    add(message, future.result())
+
+        if appendix and stages is not None:
+            logger.info('Plotting Report Stages')
+            writer.add(mg.render('table', dict(df=stage_table(stages), title='Report Stages', output=output)))
+
+
+def generate_report(filename, output='output', chunk_size=32 * 1024 * 1024, use_cache=True, rebuild_cache=False,
+                    row_filter=None, workers=1, points=3000, downsample='minmax', memory=False, formats=('png',),
+                    appendix=False, top=0, top_by='total'):
+    """
+    Read, aggregate and draw the report for one profiler file, returns the number of rows read. The
+    time, CPU, memory and rows of every stage are written to report_stages.json in output and, with
+    appendix, drawn as the last page of the report. With top, the top processes for CPU, RSS and I/O
+    ranked by top_by (total or peak) get charts of their own.
+    """
+    from Helpers import IOHistogram
+    from Helpers import ProcessData
+    from Helpers import Rollup
+    from Helpers import Stages
+    from Helpers import TopProcesses
+    from Graphers import MatplotlibGraphs as mg
+
+    stages = Stages()
+    frames = read_frames(filename, chunk_size=chunk_size, use_cache=use_cache, rebuild_cache=rebuild_cache,
+                         row_filter=row_filter, stages=stages)
+    process_df = frames['process']
+    cgroup_df = frames['cgroup']
+    if process_df is None:
+        logger.warning('No rows match the filter, no report written')
+        return 0
+
+    usage = ProcessData.memory_usage(process_df)
+    logger.info('Process data holds {} rows in {:.1f} MiB'.format(len(process_df), usage['MiB'].sum()))
+    if memory:
+        for column, row in usage.iterrows():
+            logger.info('{:>12} {:>16} {:10.2f} MiB'.format(column, row['dtype'], row['MiB']))
+
+    # one groupby shared by every time series chart
+    logger.info('Aggregating per timestamp')
+    with stages.stage('aggregate: process rollup', rows=len(process_df)):
+        process_rollup = Rollup(process_df)
+    cgroup_rollup = None
+    if cgroup_df is not None:
+        with stages.stage('aggregate: cgroup rollup', rows=len(cgroup_df)):
+            cgroup_rollup = Rollup(cgroup_df)
+
+    with stages.stage('aggregate: state segments', rows=len(process_df)):
+        segments = mg.state_segments(process_df, ['proc', 'state'])
+    with stages.stage('aggregate: io histogram', rows=len(process_df)):
+        io_dict = IOHistogram().add(process_df).to_dict()
+    top_processes = None
+    if top > 0:
+        with stages.stage('aggregate: top processes', rows=len(process_df)):
+            top_processes = TopProcesses(process_df, count=top, by=top_by)
+
+    with stages.stage('aggregate: chart data'):
+        jobs = chart_jobs(process_rollup, segments, io_dict, cgroup_rollup, output=output,
+                          top_processes=top_processes)
+
+    render_charts(jobs, output, workers=workers, points=points, downsample=downsample, formats=formats, stages=stages,
+                  appendix=appendix)
+
+    stages.write(os.path.join(output, 'report_stages.json'))
+    slowest = max(stages.records.values(), key=lambda record: record['seconds'])
+    logger.info('Stage timings written to {}, slowest was {} at {:.2f}s'.format(
+        os.path.join(output, 'report_stages.json'), slowest['stage'], slowest['seconds']))
+    return len(process_df) + (len(cgroup_df) if cgroup_df is not None else 0)
+
+
+def follow(filename, output, chunk_size, row_filter, poll, workers, points, downsample, formats=('png',)):
+    # redraw the report every poll seconds from the lines appended since the last pass
+    from Helpers import FollowState
+    from Graphers import MatplotlibGraphs as mg
+
+    state = FollowState(filename, chunk_size=chunk_size, row_filter=row_filter)
+    try:
+        while True:
+            rows = state.refresh()
+            if rows > 0 and state.process_rollup is not None:
+                logger.info('Read {} new rows up to byte {}'.format(rows, state.offset))
+                jobs = chart_jobs(state.process_rollup, mg.position_segments(state.segments.frame()),
+                                  state.io_histogram.to_dict(), state.cgroup_rollup,
+                                  output=output)
+                render_charts(jobs, output, workers=workers, points=points, downsample=downsample, formats=formats)
+            time.sleep(poll)
+    except KeyboardInterrupt:
+        logger.info('Stopped following ' + filename)
+
+
+def main():
+    logger.info('Starting ...')
+
+    # pull in arguments
+    logger.info('Reading arguments')
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-v', '--version', action='version', version='Version 1.0 - Superb Squid')
+    ap.add_argument('-i', '--input', required=True, type=str, help='Input profiler file')
+    ap.add_argument('-o', '--output', default='output', type=str, help='Directory the charts are written to')
+    ap.add_argument('-c', '--chunk-size', default=32, type=int, help='MiB of the input file parsed per chunk')
+    ap.add_argument('-j', '--jobs', default=1, type=int, help='Number of processes used to draw the charts')
+    ap.add_argument('--no-cache', action='store_true', help='Neither read nor write the parsed data cache')
+    ap.add_argument('--rebuild-cache', action='store_true', help='Ignore and rewrite the parsed data cache')
+    ap.add_argument('--points', default=3000, type=int,
+                    help='Most samples drawn per time series line, 0 draws every sample')
+    ap.add_argument('--downsample', default='minmax', choices=['minmax', 'lttb'],
+                    help='How time series are thinned down to --points samples')
+    ap.add_argument('--start', type=str, help='Only report samples at or after this date/time')
+    ap.add_argument('--end', type=str, help='Only report samples at or before this date/time')
+    ap.add_argument('--desc', action='append', type=str, help='Only report steps / processes whose name contains this')
+    ap.add_argument('--pid', action='append', type=int, help='Only report this pid')
+    ap.add_argument('--format', action='append', choices=['png', 'pdf', 'html'],
+                    help='Output format, may be repeated, pdf and html write one report file holding every chart')
+    ap.add_argument('--top', default=0, type=int,
+                    help='Add charts of the top N processes by CPU, RSS and I/O, not with --follow')
+    ap.add_argument('--top-by', default='total', choices=['total', 'peak'],
+                    help='Rank processes on their total use over the run or on their peak')
+    ap.add_argument('--appendix', action='store_true', help='Add a page of stage timings to the end of the report')
+    ap.add_argument('--memory', action='store_true', help='Log the memory used by each column of the process data')
+    ap.add_argument('-f', '--follow', action='store_true', help='Keep redrawing the report as the input grows')
+    ap.add_argument('--poll', default=30, type=float, help='Seconds between checks for new data with --follow')
+    args = ap.parse_args()
+
+    # check that the input file exists if not exit
+    if not os.path.exists(args.input):
+        logger.error('Input file does not exist')
+        exit(99)
+
+    row_filter = None
+    if args.start or args.end or args.desc or args.pid:
+        from Helpers import RowFilter
+        row_filter = RowFilter(start=args.start, end=args.end, desc=args.desc, pid=args.pid)
+
+    formats = args.format or ['png']
+    if args.follow:
+        follow(args.input, args.output, chunk_size=args.chunk_size * 1024 * 1024, row_filter=row_filter,
+               poll=args.poll, workers=args.jobs, points=args.points, downsample=args.downsample, formats=formats)
+        return
+
+    generate_report(args.input, output=args.output, chunk_size=args.chunk_size * 1024 * 1024,
+                    use_cache=not args.no_cache, rebuild_cache=args.rebuild_cache, row_filter=row_filter,
+                    workers=args.jobs, points=args.points, downsample=args.downsample, memory=args.memory,
+                    formats=formats, appendix=args.appendix, top=args.top, top_by=args.top_by)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+from Helpers import IOHistogram
+from Helpers import ProcessData
+from Helpers.helper import IO_BINS
+from Helpers.helper import IO_LABELS
+
+LINE = ('2024/01/01T10:00:00,job1/step0,1000,S,1,4,13302,4096,0,0,524832096,0,89.33,19.49,30.37,0,11.0,5.5,5.5,'
+        '4662,516,2089,{},965,4058,3682,{}')
+
+
+def sizes():
+    # every bucket edge, just above and below it, and what falls outside the buckets
+    values = []
+    for edge in IO_BINS:
+        values += [repr(float(edge)), repr(float(edge) + 0.0001), repr(float(edge) * (1 + 1e-9)),
+                   repr(float(edge) - 0.0001)]
+    return values + ['0.5', '3000.25', '8388608.5', '1e12', '-0.5', '-7', 'nan', '', 'inf', '-inf']
+
+
+def reference(values):
+    # how the report bucketed sizes before IOHistogram, pd.cut over the bytes with anything outside as 0B
+    bytes_ = pd.Series([float(value) if value else np.nan for value in values])
+    buckets = pd.cut(bytes_, bins=IO_BINS, labels=IO_LABELS).fillna('0B')
+    return buckets.value_counts().reindex(IO_LABELS, fill_value=0).tolist()
+
+
+def test_io_histogram_matches_pd_cut():
+    read, write = sizes(), sizes()[::-1]
+    df = ProcessData.build_process_dataframe([LINE.format(r, w) for r, w in zip(read, write)])
+    histogram = IOHistogram().add(df)
+
+    assert histogram.read.tolist() == reference(read)
+    assert histogram.write.tolist() == reference(write)
+
+
+def test_io_histogram_adds_chunks():
+    values = sizes()
+    df = ProcessData.build_process_dataframe([LINE.format(value, value) for value in values])
+    histogram = IOHistogram().add(df.iloc[:10]).add(df.iloc[10:])
+
+    assert histogram.to_dict() == {'columns': IO_LABELS, 'Read': reference(values), 'Write': reference(values)}
@@ -0,0 +1,86 @@
+import matplotlib.dates as mdates
+import pandas as pd
+import pytest
+from Graphers import MatplotlibGraphs
+from Helpers import StateSegments
+
+FIELDS = ['proc', 'state']
+
+
+def reference_segments(df, fields):
+    # the iterrows loop broken_barh used before state_segments, collecting segments instead of drawing them
+    index = df.index.drop_duplicates()
+    resolution = (index[1:] - index[:-1]).value_counts()
+
+    segments = []
+    for yaxis, (key, df2) in enumerate(df.groupby(fields[0], observed=True)):
+        df2 = df2.reset_index().\
+            sort_values(['timestamp', fields[1]]).\
+            drop_duplicates(['timestamp', fields[1], fields[0]], keep='first').\
+            set_index(['timestamp'])
+        df2 = df2[~df2.index.duplicated(keep='first')]
+
+        prev_state = start_state = df2[fields[1]].iloc[0]
+        prev_dt = start_dt = df2.first_valid_index()
+        seconds = 0
+        for idx, row in df2.iterrows():
+            diff = idx - prev_dt
+            seconds += diff.total_seconds()
+            if diff > resolution.index[0] or prev_state != row[fields[1]]:
+                segments.append((yaxis, key, start_state, mdates.date2num(start_dt), seconds / 60 / 60 / 24))
+                start_state = row[fields[1]]
+                start_dt = idx
+                seconds = 0
+            prev_state = row[fields[1]]
+            prev_dt = idx
+        segments.append((yaxis, key, start_state, mdates.date2num(start_dt), seconds / 60 / 60 / 24))
+    return pd.DataFrame(segments, columns=['row', 'key', 'state', 'start', 'width'])
+
+
+def frame(categorical):
+    t = pd.Timestamp('2024-01-01 10:00:00')
+    rows = [
+        # 1: R then S, a state change
+        (0, '1', 'R'), (1, '1', 'R'), (2, '1', 'S'), (3, '1', 'S'), (4, '1', 'S'), (9, '1', 'S'),
+        # 2: a 4 second gap in sampling, larger than the 1 second resolution, with the same state either side
+        (0, '2', 'S'), (1, '2', 'S'), (5, '2', 'S'), (6, '2', 'S'), (7, '2', 'R'),
+        # 3: two threads sampled at the same timestamps, the lowest state wins whatever order they come in
+        (0, '3', 'S'), (0, '3', 'R'), (1, '3', 'S'), (1, '3', 'D'), (2, '3', 'S'), (3, '3', 'Z'), (3, '3', 'S'),
+        # 4: a single sample
+        (8, '4', 'Z'),
+    ]
+    df = pd.DataFrame({'timestamp': [t + pd.Timedelta(seconds=s) for s, _, _ in rows],
+                       'proc': [proc for _, proc, _ in rows], 'state': [state for _, _, state in rows]})
+    if categorical:
+        df['state'] = df['state'].astype('category')
+    # profiler files are in timestamp order, the processes within a timestamp are not
+    return df.sort_values('timestamp', kind='stable').set_index('timestamp')
+
+
+@pytest.mark.parametrize('categorical', [False, True])
+def test_state_segments_match_iterrows(categorical):
+    df = frame(categorical)
+    expected = reference_segments(df, FIELDS)
+    segments = MatplotlibGraphs.state_segments(df, FIELDS)
+
+    assert len(segments) == len(expected)
+    for column in ['row', 'key', 'state', 'start', 'width']:
+        assert list(segments[column]) == list(expected[column]), column
+
+
+def test_state_segments_cover_cases():
+    segments = MatplotlibGraphs.state_segments(frame(False), FIELDS)
+    assert list(segments['state'][segments['key'] == '1']) == ['R', 'S', 'S']
+    assert list(segments['state'][segments['key'] == '2']) == ['S', 'S', 'R']
+    assert list(segments['state'][segments['key'] == '3']) == ['R', 'D', 'S']
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 5])
+def test_state_segments_added_in_pieces(size):
+    # as --follow adds them, including pieces that split the rows of one timestamp
+    df = frame(True)
+    segments = StateSegments(FIELDS)
+    for start in range(0, len(df), size):
+        segments.add(df.iloc[start:start + size])
+    expected = MatplotlibGraphs.state_segments(df, FIELDS)
+    pd.testing.assert_frame_equal(MatplotlibGraphs.position_segments(segments.frame()), expected)